@@ -10,15 +10,29 @@ import argparse
 import json
 from json.decoder import JSONDecodeError
 import os
-import queue
+import re
 import select
 import socket
 import sys
 import threading
+import time
 
 import requests
 from loguru import logger
 
+from splunkhec.events import EventBatch
+from splunkhec.hooks import (
+    Hooks,
+    log_hook,
+    STAGE_DROPPED,
+    STAGE_ENCODED,
+    STAGE_ENQUEUE,
+    STAGE_REQUEST_SENT,
+    STAGE_RESPONSE_RECEIVED,
+)
+from splunkhec.lanes import Lane, PriorityLanes, reserve_threads
+from splunkhec.profiling import SamplingProfiler
+
 CONFIG_FILE = "/etc/omsplunkhec.json"
 
 
@@ -101,6 +115,12 @@ parser.add_argument(
     default=int(default_config.get("max_batch", 100)),
     type=int,
 )
+parser.add_argument(
+    "--maxbytes",
+    help="max size in bytes of one batch of requests for hec",
+    default=int(default_config.get("max_bytes", 1000000)),
+    type=int,
+)
 parser.add_argument(
     "--maxqueue",
     help="max number of records to be read from rsyslog queued for transfer",
@@ -113,12 +133,35 @@ parser.add_argument(
     default=int(default_config.get("maxthreads", 10)),
     type=int,
 )
+parser.add_argument(
+    "--shutdown_timeout",
+    help="seconds to wait for queued events to be sent when stdin closes, then drop the rest (default: wait for all of them)",
+    default=default_config.get("shutdown_timeout", None),
+    type=float,
+)
 parser.add_argument(
     "--debug",
     help="turn on debug mode",
     action="store_true",
     default=bool(default_config.get("debug", False)),
 )
+parser.add_argument(
+    "--trace",
+    help="log timings and sizes at every stage of the send path",
+    action="store_true",
+    default=bool(default_config.get("trace", False)),
+)
+parser.add_argument(
+    "--profile",
+    help="run a sampling profiler for this many seconds after startup",
+    default=int(default_config.get("profile", 0)),
+    type=int,
+)
+parser.add_argument(
+    "--profile_file",
+    help="where to write the profiler stats",
+    default=default_config.get("profile_file", "/tmp/omsplunkhec.prof.txt"),
+)
 
 args = parser.parse_args()
 
@@ -141,72 +184,129 @@ SERVER_URI = "%s://%s:%s/services/collector" % (
     args.port,
 )
 
+# rsyslog templates can start the message with <PRI>, which gives us the severity
+PRI_MATCHER = re.compile(r"^<(\d{1,3})>")
+
+# callbacks for each stage of the send path, see splunkhec.hooks
+HOOKS = Hooks()
+if args.trace:
+    HOOKS.register("*", log_hook)
+
+# shared by the lane senders, so they keep their connections open between batches
+SESSION = requests.Session()
+# seconds to wait for HEC before giving up on a request, so a hung indexer can't hold a sender forever
+REQUEST_TIMEOUT = 30
+
 
 def send_splunk_events(
     hec_url=SERVER_URI,
+    batch=None,
     **kwargs,
 ):
-    """pass it the endpoint, token and a string, and it'll submit the event"""
-    if "event" not in kwargs:
-        raise ValueError("need to have at least an event value")
-
-    # if you haven't set a field, or none'd it, then just remove it
-    for key in list(kwargs):
-        if kwargs.get(key) is None:
-            del kwargs[key]
-
-    # turn them into a big batch if they're a list of events
-    if isinstance(kwargs.get("event"), list):
-        payload = []
-        settings = [key for key in kwargs if key != "event"]
-        for event in kwargs.get("event", []):
-            event_data = {"event": event}
-            for setting in settings:
-                event_data[setting] = kwargs.get(setting)
-            payload.append(event_data)
-
-    # if it's not just a string, string it
-    elif not isinstance(kwargs.get("event", ""), str):
-        payload = {}
-        payload["event"] = str(payload.get("event"))
-
-    logger.debug(payload)
-    response = requests.post(url=hec_url, json=payload, headers=HEC_HEADERS)
-    logger.debug("response: {}", response.text)
-    response.raise_for_status()
+    """pass it the endpoint and either an EventBatch, or an event (or a list of them)
+    and any of host/source/sourcetype/index, and it'll submit the events"""
+    if batch is None:
+        if "event" not in kwargs:
+            raise ValueError("need to have at least an event value")
+        event = kwargs.pop("event")
+        # if you haven't set a field, or none'd it, then just leave it out
+        batch = EventBatch(**{key: value for key, value in kwargs.items() if value is not None})
+        # turn them into a big batch if they're a list of events
+        if isinstance(event, list):
+            batch.extend(event)
+        # if it's not just a string, string it
+        else:
+            batch.append(str(event))
+
+    count = len(batch)
+    encode_start = time.perf_counter()
+    body = batch.encode()
+    HOOKS.fire(
+        STAGE_ENCODED,
+        duration=time.perf_counter() - encode_start,
+        size=len(body),
+        count=count,
+    )
+    logger.debug(body)
+
+    headers = dict(HEC_HEADERS)
+    headers["Content-Type"] = "application/json"
+    HOOKS.fire(STAGE_REQUEST_SENT, size=len(body), count=count)
+    request_start = time.perf_counter()
+    try:
+        response = SESSION.post(url=hec_url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+        HOOKS.fire(
+            STAGE_RESPONSE_RECEIVED,
+            duration=time.perf_counter() - request_start,
+            size=len(response.content),
+            count=count,
+            status_code=response.status_code,
+        )
+        logger.debug("response: {}", response.text)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as error_message:
+        HOOKS.fire(
+            STAGE_DROPPED,
+            duration=time.perf_counter() - request_start,
+            size=len(body),
+            count=count,
+            error=str(error_message),
+        )
+        raise
     return response
 
 
-# pylint: disable=unused-argument
-def handle_queue(message_queue, thread_queue_object, stop_event_object, cmdline_args):
-    """This is the entry point where actual work needs to be done. It receives
-    a list with all messages pulled from rsyslog. The list is of variable
-    length, but contains all messages that are currently available. It is
-    suggest NOT to use any further buffering, as we do not know when the
-    next message will arrive. It may be in a nanosecond from now, but it
-    may also be in three hours...
+def parse_severity(line):
+    """pulls the syslog severity out of a leading <PRI>, if the rsyslog template adds one
+
+    returns the severity (or None) and the line without the <PRI>, which only matters for routing
     """
-    while not stop_event_object.is_set() or not message_queue.empty():
-        try:
-            data = []
-            try:
-                while True and len(data) < args.maxBatch:
-                    data.append(message_queue.get(True, 1))
-                    message_queue.task_done()
-            except queue.Empty:
-                pass
-            if data:
-                send_splunk_events(
-                    hec_url=SERVER_URI,
-                    event=data,
-                    index=cmdline_args.index,
-                    sourcetype=cmdline_args.sourcetype,
-                    host=HOSTNAME,
-                )
-        except queue.Empty:
-            pass  # finalize output
-    thread_queue_object.get()
-    thread_queue_object.task_done()
+    match = PRI_MATCHER.match(line)
+    if match is None:
+        return None, line
+    # HEC won't take a blank event, so a bare <PRI> is sent as it is
+    return int(match.group(1)) % 8, line[match.end():].lstrip() or line
+
+
+def make_lane_batch(lane):
+    """makes an empty batch with our metadata, for a lane to fill"""
+    return EventBatch(
+        index=args.index,
+        sourcetype=args.sourcetype,
+        host=HOSTNAME,
+    )
+
+
+def send_lane_batch(lane, batch):
+    """sends a batch that a lane has filled"""
+    send_splunk_events(hec_url=SERVER_URI, batch=batch)
+
+
+def make_lanes(cmdline_args, config):
+    """builds the priority lanes from the "lanes" list in the config file
+
+    lanes are most urgent first, eg:
+        "lanes": [{"name": "urgent", "max_severity": 3, "max_batch": 10, "linger": 0.05, "threads": 2}]
+
+    if the last lane has no routing rules it gets everything else, otherwise a default lane
+    is added using --maxbatch/--maxbytes/--maxqueue. the last lane gets whatever threads
+    out of --maxthreads the others haven't reserved.
+
+    set "overflow" on a lane to choose what happens when its queue fills up, by default
+    the first lane blocks and the others drop their oldest events, see splunkhec.lanes
+    """
+    lanes = [Lane.from_config(lane_config) for lane_config in config.get("lanes", [])]
+    if not lanes or not lanes[-1].matches():
+        lanes.append(
+            Lane(
+                "default",
+                max_batch=cmdline_args.maxbatch,
+                max_bytes=cmdline_args.maxbytes,
+                max_queue=cmdline_args.maxqueue,
+            )
+        )
+    reserve_threads(lanes, cmdline_args.maxthreads)
+    return lanes
 
 
 LOG_FILE = "/var/log/splunkconnector.log"
@@ -243,19 +343,17 @@ POLL_PERIOD = 0.2  # the number of seconds between polling for new messages
 
 stop_event = threading.Event()
 # stop_event.set()
-maxAtOnce = args.maxBatch
-msgQueue = queue.Queue(maxsize=args.maxQueue)
-thread_queue = queue.Queue(maxsize=args.maxThreads)
-
+LANES = PriorityLanes(
+    make_lanes(args, default_config),
+    make_batch=make_lane_batch,
+    send=send_lane_batch,
+    hooks=HOOKS,
+)
+LANES.start()
 
-for i in range(args.maxThreads):
-    thread_queue.put(i)
-    worker = threading.Thread(
-        target=handle_queue,
-        args=(msgQueue, thread_queue, stop_event, args),
-    )
-    worker.daemon = True
-    worker.start()
+if args.profile:
+    logger.info("profiling for {} seconds, writing to {}", args.profile, args.profile_file)
+    SamplingProfiler().run_for(args.profile, args.profile_file)
 
 while not stop_event.is_set():
     while (
@@ -267,13 +365,15 @@ while not stop_event.is_set():
             and sys.stdin in select.select([sys.stdin], [], [], 0)[0]
         ):
             line = sys.stdin.readline()
-            if line.strip():
-                msgQueue.put(line.strip())
+            message = line.strip()
+            if message:
+                severity, message = parse_severity(message)
+                lane = LANES.put(message, severity=severity)
+                HOOKS.fire(STAGE_ENQUEUE, size=len(line), count=1, lane=lane.name)
             else:  # an empty line means stdin has been closed
                 stop_event.set()
-                msgQueue.join()
 
 logger.info("waiting for thread shutdown")
-thread_queue.join()
+LANES.stop(timeout=args.shutdown_timeout)
 
 sys.stdout.flush()  # very important, Python buffers far too much!
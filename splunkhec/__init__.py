@@ -1,17 +1,34 @@
 """class for dealing with splunk HTTP event collectors"""
 
-from typing import Any, Dict, Optional
+import json
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
 from urllib.parse import urlparse
 
 
 from loguru import logger
 import requests
 
+from .events import EventBatch, HecEvent
+from .hooks import (
+    Hooks,
+    STAGE_COMPRESSED,
+    STAGE_DROPPED,
+    STAGE_ENCODED,
+    STAGE_REQUEST_SENT,
+    STAGE_RESPONSE_RECEIVED,
+)
+from .metrics import encode_metric_events, make_metric_event
+from .streaming import END_OF_EVENTS, BodyStream, EventFeeder
 from .utilities import validate_token_format
 
+if TYPE_CHECKING:
+    from .fleet import HealthCache
+
 TEST_SOURCETYPE = "test_hec_event"
 URI_CACHE_MAXSIZE = 1024
 DEFAULT_ENDPOINT = "/services/collector"
+HEALTH_ENDPOINT = "/services/collector/health"
 
 """
 services/collector/health
@@ -63,12 +80,13 @@ def do_get_request(token: str, **kwargs: Any) -> requests.Response:
             endpoint,
             kwargs.get("secure", True),
         )
-    headers = make_headers(token, kwargs.get("headers", ""))
-    response = requests.get(
+    headers = make_headers(token, kwargs.get("headers"))
+    session = kwargs.get("session")
+    response: requests.Response = (session or requests).get(
         uri,
         headers=headers,
         params=kwargs.get("params"),
-        timeout=30,
+        timeout=kwargs.get("timeout", 30),
     )
     return response
 
@@ -128,7 +146,7 @@ class splunkhec:
         self,
         server: str,
         token: Optional[str] = None,
-        **kwargs: Dict[str, Any],
+        **kwargs: Any,
     ) -> None:
         """start up the jam
         expected variables
@@ -138,6 +156,9 @@ class splunkhec:
         - token (a default token to use)
         - secure (bool: use https if true)
         - verbose (bool: how noisy to be)
+        - hooks (splunkhec.hooks.Hooks: callbacks for tracing the send path)
+        - session (requests.Session: reused between requests, one is made if not supplied)
+        - health_cache (splunkhec.fleet.HealthCache: where cached_health looks for results)
         """
         if token is not None:
             if validate_token_format(token):
@@ -145,32 +166,46 @@ class splunkhec:
         self.server = server
         self.secure = kwargs.get("secure", True)
         self.verbose = kwargs.get("verbose", False)
+        hooks = kwargs.get("hooks")
+        self.hooks = hooks if isinstance(hooks, Hooks) else Hooks()
+        session = kwargs.get("session")
+        self.session = session if isinstance(session, requests.Session) else requests.Session()
+        self.health_cache: Optional["HealthCache"] = kwargs.get("health_cache")
 
     def is_healthy(
         self,
         verbose: bool = False,
     ) -> Any:
         """
+        checks the HEC health endpoint, which also checks the token
+
         if verbose: returns a dict {'result' : bool, 'description' : str}
         else: returns a bool
         """
-        validate_token_format(self.token)
-
         uri = make_uri(
             self.server,
-            "/services/collector/event",
+            HEALTH_ENDPOINT,
             bool(self.secure),
         )
-        headers = {"Authorisation": f"Splunk {self.token}"}
-        response = do_get_request(token=self.token, uri=uri, headers=headers)
+        response = do_get_request(token=self.get_token({}), uri=uri, session=self.session)
         if response.status_code not in STATUS_CODE_MAP:
             raise ValueError(
                 f"Unknown status code returned: {response.status_code} - {response.text}"
             )
         if verbose:
-            return [response.status_code]
+            return STATUS_CODE_MAP[response.status_code]
         return STATUS_CODE_MAP[response.status_code].get("result")
 
+    def cached_health(self) -> Optional[bool]:
+        """returns the last result from the health_cache without making a request,
+        or None if there isn't a cache or a fresh result in it"""
+        if self.health_cache is None:
+            return None
+        result = self.health_cache.get(self.server, self.get_token({}), bool(self.secure))
+        if result is None:
+            return None
+        return bool(result.result)
+
     @classmethod
     def send_single_event(cls, event: Dict[str, Any]) -> None:
         """send this a dict and it'll send the event to the server as JSON"""
@@ -186,7 +221,7 @@ class splunkhec:
             return str(getattr(self, "token"))
         raise ValueError("Someone forgot to specify a token")
 
-    def send_test_event(self, **kwargs: Dict[str, Any]) -> bool:
+    def send_test_event(self, **kwargs: Any) -> bool:
         """
         sends a test event to validate that the token works
 
@@ -196,33 +231,224 @@ class splunkhec:
         """
         logger.debug(f"sending test event: {kwargs}")
 
-        data = {
-            "event": {"token": self.get_token(kwargs)},
-            "sourcetype": kwargs.get("sourcetype", TEST_SOURCETYPE),
-        }
-        response = self.do_post_request(
-            data=data,
-        )
+        batch = EventBatch(sourcetype=kwargs.get("sourcetype", TEST_SOURCETYPE))
+        batch.append(HecEvent({"token": self.get_token(kwargs)}))
+        response = self.send_batch(batch)
         logger.debug(response)
         logger.debug(STATUS_CODE_MAP[response.status_code])
         if response.status_code in STATUS_CODE_MAP:
             return bool(STATUS_CODE_MAP[response.status_code]["result"])
         return False
 
+    def send_batch(
+        self,
+        batch: EventBatch,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """sends an EventBatch, kwargs are passed through to do_post_request, eg endpoint"""
+        if not batch:
+            raise ValueError("batch is empty")
+        encode_start = time.perf_counter()
+        body = batch.encode()
+        self.hooks.fire(
+            STAGE_ENCODED,
+            duration=time.perf_counter() - encode_start,
+            size=len(body),
+            count=len(batch),
+        )
+        response = self.do_post_request(
+            body=body,
+            count=len(batch),
+            **kwargs,
+        )
+        return response
+
+    def _send_body(self, stream: BodyStream) -> Iterator[bytes]:
+        """hands a streamed body to requests, firing request_sent once all of it's gone
+
+        the size and count aren't known until then
+        """
+        yield from stream
+        self.hooks.fire(STAGE_REQUEST_SENT, size=stream.sent_bytes, count=stream.count)
+
+    def send_stream(
+        self,
+        events: Iterable[Any],
+        **kwargs: Any,
+    ) -> List[requests.Response]:
+        """streams events from an iterable or generator with chunked transfer encoding
+
+        events are taken from the iterable in a background thread and encoded and sent as
+        they arrive, so memory stays flat however big the request gets. each request is
+        closed at max_bytes (uncompressed), max_events or max_seconds, even if the iterable
+        has stalled, and the rest go in the next one. stops at the first response that
+        isn't a success, so the last response tells you if everything went.
+
+        optional variables
+        - host, source, sourcetype, index (shared by every event, HecEvents can override them)
+        - max_bytes, max_events, max_seconds, chunk_size (see splunkhec.streaming.BodyStream)
+        - compress (bool: gzip the body as it's sent)
+        - endpoint (str: defaults to /services/collector/event)
+        """
+        endpoint = str(kwargs.pop("endpoint", "/services/collector/event"))
+        encoder = EventBatch(
+            host=kwargs.pop("host", None),
+            source=kwargs.pop("source", None),
+            sourcetype=kwargs.pop("sourcetype", None),
+            index=kwargs.pop("index", None),
+        )
+        headers = make_headers(self.token)
+        headers["Content-Type"] = "application/json"
+        if kwargs.get("compress"):
+            headers["Content-Encoding"] = "gzip"
+        uri = make_uri(self.server, endpoint=endpoint, secure=bool(self.secure))
+
+        feeder = EventFeeder(events)
+        responses: List[requests.Response] = []
+        while True:
+            # no request is open yet, so it's fine to wait as long as it takes
+            first = feeder.get()
+            if first is END_OF_EVENTS:
+                break
+            stream = BodyStream(first, feeder, encoder, **kwargs)
+            request_start = time.perf_counter()
+            try:
+                response = self.session.post(
+                    url=uri,
+                    headers=headers,
+                    timeout=30,
+                    data=self._send_body(stream),
+                )
+            except requests.exceptions.RequestException as error_message:
+                feeder.stop()
+                self.hooks.fire(
+                    STAGE_DROPPED,
+                    duration=time.perf_counter() - request_start,
+                    size=stream.sent_bytes,
+                    count=stream.count,
+                    error=str(error_message),
+                )
+                raise
+            self.hooks.fire(
+                STAGE_ENCODED,
+                duration=stream.encode_time,
+                size=stream.raw_bytes,
+                count=stream.count,
+            )
+            if stream.compress:
+                self.hooks.fire(
+                    STAGE_COMPRESSED,
+                    duration=stream.compress_time,
+                    size=stream.sent_bytes,
+                    count=stream.count,
+                )
+            self.hooks.fire(
+                STAGE_RESPONSE_RECEIVED,
+                duration=time.perf_counter() - request_start,
+                size=len(response.content),
+                count=stream.count,
+                status_code=response.status_code,
+            )
+            responses.append(response)
+            if stream.exhausted or not response.ok:
+                break
+        feeder.stop()
+        if feeder.error is not None:
+            raise feeder.error
+        return responses
+
+    def send_metrics(
+        self,
+        metrics: List[Dict[str, Any]],
+        **kwargs: Any,
+    ) -> requests.Response:
+        """sends a batch of metric data points, see splunkhec.metrics.make_metric_event
+
+        kwargs are passed through to do_post_request, eg endpoint
+        """
+        if not metrics:
+            raise ValueError("need at least one metric data point")
+        kwargs.setdefault("endpoint", "/services/collector/event")
+        response = self.do_post_request(
+            body=encode_metric_events(metrics),
+            count=len(metrics),
+            **kwargs,
+        )
+        return response
+
+    def send_metric(
+        self,
+        measurements: Dict[str, float],
+        dimensions: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """sends a single multi-measurement data point, eg send_metric({"cpu.idle": 90.1}, {"host": "web01"})
+
+        kwargs can be timestamp, index, host, source or sourcetype
+        """
+        return self.send_metrics(
+            [make_metric_event(measurements, dimensions, **kwargs)],
+        )
+
     def do_post_request(
         self,
-        **kwargs: Dict[str, Any],
+        **kwargs: Any,
     ) -> requests.Response:
-        """does a post request to an endpoint"""
+        """does a post request to an endpoint
+
+        pass either data (something to turn into JSON) or body (bytes that are already
+        encoded HEC events, with count being how many events are in it)
+
+        if the request fails the dropped hook is fired, unless retrying is True because
+        the caller's going to try again (and fire it themselves when they give up)
+        """
         endpoint = str(kwargs.get("endpoint", DEFAULT_ENDPOINT))
-        response = requests.post(
-            url=make_uri(
-                self.server,
-                endpoint=endpoint,
-                secure=bool(self.secure),
-            ),
-            headers=make_headers(self.token),
-            timeout=30,
-            json=kwargs.get("data"),
+        body = kwargs.get("body")
+        if isinstance(body, bytes):
+            count = int(kwargs.get("count", 1))
+        else:
+            data = kwargs.get("data")
+            count = len(data) if isinstance(data, list) else 1
+
+            encode_start = time.perf_counter()
+            body = json.dumps(data).encode("utf-8")
+            self.hooks.fire(
+                STAGE_ENCODED,
+                duration=time.perf_counter() - encode_start,
+                size=len(body),
+                count=count,
+            )
+
+        headers = make_headers(self.token)
+        headers["Content-Type"] = "application/json"
+        self.hooks.fire(STAGE_REQUEST_SENT, size=len(body), count=count)
+        request_start = time.perf_counter()
+        try:
+            response = self.session.post(
+                url=make_uri(
+                    self.server,
+                    endpoint=endpoint,
+                    secure=bool(self.secure),
+                ),
+                headers=headers,
+                timeout=30,
+                data=body,
+            )
+        except requests.exceptions.RequestException as error_message:
+            if not kwargs.get("retrying"):
+                self.hooks.fire(
+                    STAGE_DROPPED,
+                    duration=time.perf_counter() - request_start,
+                    size=len(body),
+                    count=count,
+                    error=str(error_message),
+                )
+            raise
+        self.hooks.fire(
+            STAGE_RESPONSE_RECEIVED,
+            duration=time.perf_counter() - request_start,
+            size=len(response.content),
+            count=count,
+            status_code=response.status_code,
         )
         return response
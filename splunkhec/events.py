@@ -0,0 +1,204 @@
+"""typed events and batches, rather than a dict per event
+
+    batch = EventBatch(host="web01", sourcetype="syslog", index="main")
+    batch.append("first line")
+    batch.append(HecEvent("second line", time=1600000000.0))
+    if batch.size > 1000000:
+        hec.send_batch(batch)
+
+an EventBatch encodes the metadata that's shared by every event once, and encodes each
+event as it's added, keeping only that event's own bytes. the shared metadata is only
+added back when the batch is encoded for sending, so it isn't stored once per event,
+and checking how big a batch is doesn't mean serialising it again.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+METADATA_KEYS = ("host", "source", "sourcetype", "index")
+
+
+def _encode_value(value: Any) -> bytes:
+    """JSON encodes a single value"""
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+class HecEvent:
+    """a single HEC event"""
+
+    __slots__ = ("event", "time", "host", "source", "sourcetype", "index", "fields")
+
+    def __init__(
+        self,
+        event: Any,
+        time: Optional[float] = None,
+        host: Optional[str] = None,
+        source: Optional[str] = None,
+        sourcetype: Optional[str] = None,
+        index: Optional[str] = None,
+        fields: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.event = event
+        self.time = time
+        self.host = host
+        self.source = source
+        self.sourcetype = sourcetype
+        self.index = index
+        self.fields = fields
+
+    def __repr__(self) -> str:
+        return f"HecEvent({self.to_dict()!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, HecEvent):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """the HEC envelope, without any fields that aren't set"""
+        result: Dict[str, Any] = {"event": self.event}
+        for key in self.__slots__[1:]:
+            value = getattr(self, key)
+            if value is not None:
+                result[key] = value
+        return result
+
+    def encode(self) -> bytes:
+        """the HEC envelope as JSON"""
+        return _encode_value(self.to_dict())
+
+
+class EventBatch:
+    """a batch of events that share host, source, sourcetype and index
+
+    events can still override any of those, the override is kept for just that event.
+    only the encoded form of each event is kept, iterating over the batch decodes them again.
+    """
+
+    __slots__ = (
+        "metadata",
+        "encoded",
+        "overrides",
+        "size",
+        "_suffix",
+    )
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        source: Optional[str] = None,
+        sourcetype: Optional[str] = None,
+        index: Optional[str] = None,
+    ) -> None:
+        self.metadata: Dict[str, str] = {}
+        for key, value in zip(METADATA_KEYS, (host, source, sourcetype, index)):
+            if value is not None:
+                self.metadata[key] = value
+        # each event's own bytes, without the metadata or the closing brace
+        self.encoded: List[bytes] = []
+        # the metadata for events that override some of it, by position, most events won't
+        self.overrides: Dict[int, bytes] = {}
+        # bytes the batch takes on the wire, including the newlines between events
+        self.size = 0
+        # the shared metadata, encoded once and added to the end of each event when it's sent
+        self._suffix = self._encode_metadata(self.metadata)
+
+    @staticmethod
+    def _encode_metadata(metadata: Dict[str, str]) -> bytes:
+        """the end of an event, from the metadata onwards"""
+        if metadata:
+            return b"," + _encode_value(metadata)[1:]
+        return b"}"
+
+    def __len__(self) -> int:
+        return len(self.encoded)
+
+    def __iter__(self) -> Iterator[HecEvent]:
+        for position in range(len(self.encoded)):
+            yield self[position]
+
+    def __getitem__(self, position: int) -> HecEvent:
+        if position < 0:
+            position += len(self.encoded)
+        decoded = json.loads(self.encoded[position] + self.overrides.get(position, self._suffix))
+        return HecEvent(decoded.pop("event"), **decoded)
+
+    def _encode_parts(
+        self,
+        event: Union[HecEvent, Any],
+        time: Optional[float] = None,
+        fields: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[bytes, Optional[bytes]]:
+        """encodes an event, returns its own bytes and the metadata if it overrides any"""
+        override: Optional[Dict[str, str]] = None
+        if isinstance(event, HecEvent):
+            for key in METADATA_KEYS:
+                value = getattr(event, key)
+                if value is not None and value != self.metadata.get(key):
+                    if override is None:
+                        override = {}
+                    override[key] = value
+            time = event.time
+            fields = event.fields
+            event = event.event
+
+        parts = [b'{"event":', _encode_value(event)]
+        if time is not None:
+            parts.extend((b',"time":', _encode_value(time)))
+        if fields:
+            parts.extend((b',"fields":', _encode_value(fields)))
+        if override:
+            metadata = dict(self.metadata)
+            metadata.update(override)
+            return b"".join(parts), self._encode_metadata(metadata)
+        return b"".join(parts), None
+
+    def encode_event(
+        self,
+        event: Union[HecEvent, Any],
+        time: Optional[float] = None,
+        fields: Optional[Dict[str, Any]] = None,
+    ) -> bytes:
+        """encodes an event with this batch's metadata, without adding it to the batch"""
+        encoded, suffix = self._encode_parts(event, time, fields)
+        return encoded + (suffix or self._suffix)
+
+    def append(
+        self,
+        event: Union[HecEvent, Any],
+        time: Optional[float] = None,
+        fields: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """adds an event, either a HecEvent or just the event body, returns the new size in bytes"""
+        encoded, suffix = self._encode_parts(event, time, fields)
+        if self.encoded:
+            self.size += 1
+        if suffix is None:
+            suffix = self._suffix
+        else:
+            self.overrides[len(self.encoded)] = suffix
+        self.encoded.append(encoded)
+        self.size += len(encoded) + len(suffix)
+        return self.size
+
+    def extend(self, events: List[Any]) -> int:
+        """adds a list of events, returns the new size in bytes"""
+        for event in events:
+            self.append(event)
+        return self.size
+
+    def clear(self) -> None:
+        """empties the batch, keeping the shared metadata"""
+        self.encoded.clear()
+        self.overrides.clear()
+        self.size = 0
+
+    def encode(self) -> bytes:
+        """the body for a HEC request, one event per line"""
+        parts: List[bytes] = []
+        for position, encoded in enumerate(self.encoded):
+            if position:
+                parts.append(b"\n")
+            parts.append(encoded)
+            parts.append(self.overrides.get(position, self._suffix))
+        return b"".join(parts)
@@ -0,0 +1,216 @@
+"""checking the health of lots of HEC servers and tokens at once
+
+    results = check_fleet([("idx1.example.com:8088", token1), ("idx2.example.com:8088", token2)])
+    for result in results:
+        print(result.server, result.result, result.description)
+
+results go into a HealthCache (DEFAULT_CACHE unless you hand it another one), which
+senders can look at without making a request:
+
+    hec = splunkhec(server="idx1.example.com:8088", token=token1, health_cache=DEFAULT_CACHE)
+    if hec.cached_health() is False:
+        ...
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from . import HEALTH_ENDPOINT, STATUS_CODE_MAP, do_get_request, make_uri
+from .utilities import mask_token
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_WORKERS = 32
+DEFAULT_TTL = 60.0
+
+CacheKey = Tuple[str, str]
+
+
+class CheckResult:
+    """the outcome of checking one (server, token) pair"""
+
+    __slots__ = ("server", "token", "result", "status_code", "description", "elapsed", "checked_at")
+
+    def __init__(
+        self,
+        server: str,
+        token: str,
+        result: bool,
+        status_code: Optional[int],
+        description: str,
+        elapsed: float,
+    ) -> None:
+        self.server = server
+        self.token = token
+        self.result = result
+        self.status_code = status_code
+        self.description = description
+        self.elapsed = elapsed
+        self.checked_at = time.time()
+
+    def __repr__(self) -> str:
+        return f"CheckResult({self.to_dict()!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """the result as a dict, with the token masked"""
+        return {
+            "server": self.server,
+            "token": mask_token(self.token),
+            "result": self.result,
+            "status_code": self.status_code,
+            "description": self.description,
+            "elapsed": round(self.elapsed, 3),
+            "checked_at": self.checked_at,
+        }
+
+
+def cache_key(server: str, token: str, secure: bool = True) -> CacheKey:
+    """servers can be written a few ways, so key on the URI we'd actually check"""
+    try:
+        return (make_uri(server, HEALTH_ENDPOINT, secure), token)
+    except ValueError:
+        return (server, token)
+
+
+class HealthCache:
+    """keeps check results for ttl seconds"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.results: Dict[CacheKey, CheckResult] = {}
+
+    def set(self, result: CheckResult, secure: bool = True) -> None:
+        """stores a result"""
+        with self.lock:
+            self.results[cache_key(result.server, result.token, secure)] = result
+
+    def get(self, server: str, token: str, secure: bool = True) -> Optional[CheckResult]:
+        """returns the last result for a pair, or None if there isn't one from the last ttl seconds"""
+        key = cache_key(server, token, secure)
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                return None
+            if time.time() - result.checked_at > self.ttl:
+                del self.results[key]
+                return None
+            return result
+
+    def clear(self) -> None:
+        """forgets everything"""
+        with self.lock:
+            self.results.clear()
+
+
+DEFAULT_CACHE = HealthCache()
+
+
+def check_one(
+    server: str,
+    token: str,
+    timeout: float = DEFAULT_TIMEOUT,
+    secure: bool = True,
+) -> CheckResult:
+    """checks a single (server, token) pair against the health endpoint, never raises"""
+    start = time.perf_counter()
+    try:
+        response = do_get_request(
+            token=token,
+            uri=make_uri(server, HEALTH_ENDPOINT, secure),
+            timeout=timeout,
+        )
+    except requests.exceptions.RequestException as error_message:
+        return CheckResult(server, token, False, None, f"Request failed: {error_message}", time.perf_counter() - start)
+    except ValueError as error_message:
+        return CheckResult(server, token, False, None, str(error_message), time.perf_counter() - start)
+    elapsed = time.perf_counter() - start
+    status = STATUS_CODE_MAP.get(response.status_code)
+    if status is None:
+        return CheckResult(
+            server,
+            token,
+            False,
+            response.status_code,
+            f"Unknown status code returned: {response.status_code} - {response.text}",
+            elapsed,
+        )
+    return CheckResult(server, token, bool(status["result"]), response.status_code, str(status["description"]), elapsed)
+
+
+def check_fleet(
+    pairs: Iterable[Tuple[str, str]],
+    timeout: float = DEFAULT_TIMEOUT,
+    **kwargs: Any,
+) -> List[CheckResult]:
+    """checks lots of (server, token) pairs at once, returns the results in the same order
+
+    optional variables
+    - workers (int: how many checks run at once)
+    - secure (bool: use https)
+    - cache (HealthCache: where results go, defaults to DEFAULT_CACHE)
+    """
+    pairs = list(pairs)
+    secure = bool(kwargs.get("secure", True))
+    cache: HealthCache = kwargs.get("cache") or DEFAULT_CACHE
+    workers = max(1, min(int(kwargs.get("workers", DEFAULT_WORKERS)), len(pairs)))
+
+    def _check(pair: Tuple[str, str]) -> CheckResult:
+        result = check_one(pair[0], pair[1], timeout=timeout, secure=secure)
+        cache.set(result, secure)
+        return result
+
+    if not pairs:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_check, pairs))
+
+
+def main() -> None:
+    """entry point for splunkhec-fleetcheck"""
+    parser = argparse.ArgumentParser(description="check the health of many Splunk HEC servers and tokens")
+    parser.add_argument("--server", action="append", default=[], help="hostname, can be given more than once")
+    parser.add_argument("--token", action="append", default=[], help="token, can be given more than once")
+    parser.add_argument(
+        "--pairs",
+        help="file of server,token lines to check, as well as every combination of --server and --token",
+    )
+    parser.add_argument("--insecure", action="store_true", help="use http instead of https")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds for each check")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="how many checks run at once")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args()
+
+    pairs = list(product(args.server, args.token))
+    if args.pairs:
+        with open(args.pairs, "r", encoding="utf-8") as file_handle:
+            for line_number, line in enumerate(file_handle, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "," not in line:
+                    parser.error(f"{args.pairs} line {line_number}: expected server,token")
+                server, token = line.split(",", 1)
+                pairs.append((server.strip(), token.strip()))
+    if not pairs:
+        parser.error("need --server and --token, or --pairs")
+
+    results = check_fleet(pairs, timeout=args.timeout, workers=args.workers, secure=not args.insecure)
+    for result in results:
+        if args.json:
+            print(json.dumps(result.to_dict()))
+        else:
+            state = "OK" if result.result else "FAIL"
+            print(f"{state:<4} {result.server} {mask_token(result.token)} {result.elapsed:.3f}s {result.description}")
+    sys.exit(0 if all(result.result for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
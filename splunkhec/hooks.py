@@ -0,0 +1,97 @@
+"""stage hooks for tracing and profiling the send path
+
+register a callback against one of the STAGE_* names and it'll be called with a dict
+every time an event or batch crosses that stage boundary, eg:
+
+    from splunkhec.hooks import Hooks, STAGE_RESPONSE_RECEIVED
+    hooks = Hooks()
+    hooks.register(STAGE_RESPONSE_RECEIVED, lambda info: print(info["duration"]))
+    hec = splunkhec(server="example.com:8088", token=token, hooks=hooks)
+
+the dict always has "stage" and "timestamp" (time.time()), and where they make sense:
+- duration (float: seconds spent in the stage, from time.perf_counter())
+- size (int: bytes)
+- count (int: number of events)
+- status_code (int: HTTP status from the server)
+- error (str: why something was retried or dropped)
+"""
+
+import time
+from typing import Any, Callable, Dict, List
+
+from loguru import logger
+
+STAGE_ENQUEUE = "enqueue"
+STAGE_BATCH_CLOSED = "batch_closed"
+STAGE_ENCODED = "encoded"
+STAGE_COMPRESSED = "compressed"
+STAGE_REQUEST_SENT = "request_sent"
+STAGE_RESPONSE_RECEIVED = "response_received"
+STAGE_RETRIED = "retried"
+STAGE_DROPPED = "dropped"
+
+STAGES = (
+    STAGE_ENQUEUE,
+    STAGE_BATCH_CLOSED,
+    STAGE_ENCODED,
+    STAGE_COMPRESSED,
+    STAGE_REQUEST_SENT,
+    STAGE_RESPONSE_RECEIVED,
+    STAGE_RETRIED,
+    STAGE_DROPPED,
+)
+
+HookCallback = Callable[[Dict[str, Any]], None]
+
+
+class Hooks:
+    """a set of callbacks, keyed by stage"""
+
+    def __init__(self) -> None:
+        self.callbacks: Dict[str, List[HookCallback]] = {stage: [] for stage in STAGES}
+
+    def register(self, stage: str, callback: HookCallback) -> None:
+        """adds a callback for a stage, use "*" to get every stage"""
+        if stage == "*":
+            for stage_name in STAGES:
+                self.register(stage_name, callback)
+            return
+        if stage not in self.callbacks:
+            raise ValueError(f"Unknown stage: {stage}, should be one of {STAGES}")
+        self.callbacks[stage].append(callback)
+
+    def unregister(self, stage: str, callback: HookCallback) -> None:
+        """removes a callback from a stage, use "*" to remove it from every stage"""
+        if stage == "*":
+            for stage_name in STAGES:
+                if callback in self.callbacks[stage_name]:
+                    self.unregister(stage_name, callback)
+            return
+        if stage not in self.callbacks:
+            raise ValueError(f"Unknown stage: {stage}, should be one of {STAGES}")
+        self.callbacks[stage].remove(callback)
+
+    def enabled(self, stage: str) -> bool:
+        """returns True if anything is listening on this stage"""
+        return bool(self.callbacks.get(stage))
+
+    def fire(self, stage: str, **kwargs: Any) -> None:
+        """calls everything registered against a stage
+
+        a broken callback gets logged, it won't stop events from being sent
+        """
+        callbacks = self.callbacks.get(stage)
+        if not callbacks:
+            return
+        info: Dict[str, Any] = {"stage": stage, "timestamp": time.time()}
+        info.update(kwargs)
+        for callback in callbacks:
+            try:
+                callback(info)
+            except Exception as hook_error:  # pylint: disable=broad-except
+                logger.error("Hook {} failed on stage {}: {}", callback, stage, hook_error)
+
+
+def log_hook(info: Dict[str, Any]) -> None:
+    """a callback that logs everything at debug level, register it with stage="*" """
+    logger.debug("hook: {}", info)
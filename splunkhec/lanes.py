@@ -0,0 +1,288 @@
+"""priority lanes, so urgent events don't wait behind a backlog of bulk ones
+
+each lane has its own queue, batch settings and sender threads, so an error doesn't sit
+in the same FIFO as debug noise. events are routed to the first lane that matches, by
+syslog severity, loguru level or a regex on the text, and anything that doesn't match
+goes to the last lane.
+
+    lanes = PriorityLanes(
+        [
+            Lane("urgent", max_severity=3, min_level=40, max_batch=10, linger=0.05, threads=2),
+            Lane("bulk", max_batch=500, linger=1.0, threads=8),
+        ],
+        make_batch=lambda lane: EventBatch(index="main"),
+        send=lambda lane, batch: hec.send_batch(batch),
+    )
+    lanes.start()
+    lanes.put("disk on fire", severity=2)
+
+when a lane's queue is full, what put() does is up to the lane's overflow setting. the
+most urgent lane blocks by default, so nothing in it is lost, while the rest drop their
+oldest event (reporting it on the dropped hook), so a backlog of bulk events can't stop
+urgent ones from being queued.
+"""
+
+import queue
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from .events import EventBatch
+from .hooks import Hooks, STAGE_BATCH_CLOSED, STAGE_DROPPED
+
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_BYTES = 1000000
+DEFAULT_LINGER = 1.0
+DEFAULT_MAX_QUEUE = 1000
+# what put() does when a lane's queue is full
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_NEW = "drop_new"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_NEW, OVERFLOW_DROP_OLDEST)
+# how long stop() waits for the senders to empty the queues
+DEFAULT_STOP_TIMEOUT = 10.0
+# how often idle senders check if they've been asked to stop
+POLL_PERIOD = 0.2
+
+
+class Lane:
+    """one priority class"""
+
+    def __init__(self, name: str, **kwargs: Any) -> None:
+        """
+        optional variables, for routing (any of them matching is enough, none set matches everything)
+        - max_severity (int: syslog severity, 0 is emergency and 7 is debug, matches this and more urgent)
+        - min_level (int: loguru level number, eg 40 for ERROR, matches this and above)
+        - pattern (str: regex searched for in the event text)
+
+        and for sending
+        - max_batch (int: most events in one request)
+        - max_bytes (int: biggest request body)
+        - linger (float: longest a batch waits to fill up after its first event, in seconds)
+        - threads (int: sender threads reserved for this lane)
+        - max_queue (int: events queued before the overflow policy kicks in)
+        - overflow (str: "block" to wait for space, "drop_new" to drop the event being added or
+          "drop_oldest" to make room by dropping the oldest queued one. defaults to "block" for
+          the most urgent lane and "drop_oldest" for the rest)
+        """
+        self.name = name
+        self.max_severity: Optional[int] = kwargs.get("max_severity")
+        self.min_level: Optional[int] = kwargs.get("min_level")
+        pattern = kwargs.get("pattern")
+        self.pattern = re.compile(pattern) if pattern else None
+        self.max_batch = int(kwargs.get("max_batch", DEFAULT_MAX_BATCH))
+        self.max_bytes = int(kwargs.get("max_bytes", DEFAULT_MAX_BYTES))
+        self.linger = float(kwargs.get("linger", DEFAULT_LINGER))
+        self.threads = int(kwargs.get("threads", 1))
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=int(kwargs.get("max_queue", DEFAULT_MAX_QUEUE)))
+        self.overflow: Optional[str] = kwargs.get("overflow")
+        if self.overflow is not None and self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {self.overflow}, should be one of {OVERFLOW_POLICIES}")
+        # events thrown away because the queue was full
+        self.dropped = 0
+
+    def __repr__(self) -> str:
+        return f"Lane({self.name!r})"
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Lane":
+        """makes a lane from a config dict, eg {"name": "urgent", "max_severity": 3, "threads": 2}"""
+        config = dict(config)
+        return cls(config.pop("name"), **config)
+
+    def matches(
+        self,
+        severity: Optional[int] = None,
+        level: Optional[int] = None,
+        text: Optional[str] = None,
+    ) -> bool:
+        """works out if an event belongs in this lane"""
+        if self.max_severity is None and self.min_level is None and self.pattern is None:
+            return True
+        if self.max_severity is not None and severity is not None and severity <= self.max_severity:
+            return True
+        if self.min_level is not None and level is not None and level >= self.min_level:
+            return True
+        if self.pattern is not None and text is not None and self.pattern.search(text):
+            return True
+        return False
+
+
+def log_send_error(lane: Lane, error: Exception) -> None:
+    """default error handler for senders"""
+    logger.error("Failed to send batch from lane {}: {}", lane.name, error)
+
+
+class PriorityLanes:
+    """routes events to lanes and runs the sender threads for them"""
+
+    def __init__(
+        self,
+        lanes: List[Lane],
+        make_batch: Callable[[Lane], EventBatch],
+        send: Callable[[Lane, EventBatch], Any],
+        **kwargs: Any,
+    ) -> None:
+        """
+        - lanes (most urgent first, the last one gets anything that doesn't match)
+        - make_batch (returns an empty EventBatch for a lane, with the metadata set)
+        - send (sends a batch)
+
+        optional variables
+        - hooks (splunkhec.hooks.Hooks: batch_closed is fired with the lane name)
+        - on_error (called with the lane and exception when send raises, defaults to logging it)
+        """
+        if not lanes:
+            raise ValueError("need at least one lane")
+        for lane in lanes:
+            if lane.overflow is None:
+                lane.overflow = OVERFLOW_BLOCK if lane is lanes[0] else OVERFLOW_DROP_OLDEST
+        self.lanes = lanes
+        self.make_batch = make_batch
+        self.send = send
+        self.hooks: Hooks = kwargs.get("hooks") or Hooks()
+        self.on_error: Callable[[Lane, Exception], None] = kwargs.get("on_error", log_send_error)
+        self.stop_event = threading.Event()
+        # set when stop() gives up waiting, senders should stop retrying when they see it
+        self.abandoned = threading.Event()
+        self.threads: List[threading.Thread] = []
+
+    def route(
+        self,
+        severity: Optional[int] = None,
+        level: Optional[int] = None,
+        text: Optional[str] = None,
+    ) -> Lane:
+        """finds the lane for an event"""
+        for lane in self.lanes:
+            if lane.matches(severity=severity, level=level, text=text):
+                return lane
+        return self.lanes[-1]
+
+    def put(
+        self,
+        event: Any,
+        severity: Optional[int] = None,
+        level: Optional[int] = None,
+        text: Optional[str] = None,
+    ) -> Lane:
+        """queues an event in the right lane, if that lane's queue is full it's up to the lane's overflow policy"""
+        if text is None and isinstance(event, str):
+            text = event
+        lane = self.route(severity=severity, level=level, text=text)
+        if lane.overflow == OVERFLOW_BLOCK:
+            lane.queue.put(event)
+            return lane
+        while True:
+            try:
+                lane.queue.put_nowait(event)
+                return lane
+            except queue.Full:
+                pass
+            if lane.overflow == OVERFLOW_DROP_NEW:
+                self.drop_overflow(lane)
+                return lane
+            try:
+                lane.queue.get_nowait()
+            except queue.Empty:
+                # a sender got there first, so there's room now
+                continue
+            self.drop_overflow(lane)
+
+    def drop_overflow(self, lane: Lane) -> None:
+        """counts an event dropped because a lane's queue was full"""
+        lane.dropped += 1
+        self.hooks.fire(STAGE_DROPPED, count=1, lane=lane.name, error="lane queue full")
+
+    def start(self) -> None:
+        """starts the sender threads"""
+        if self.threads:
+            raise RuntimeError("Senders are already running")
+        self.stop_event.clear()
+        self.abandoned.clear()
+        for lane in self.lanes:
+            for number in range(lane.threads):
+                thread = threading.Thread(
+                    target=self.sender,
+                    args=(lane,),
+                    name=f"splunkhec-lane-{lane.name}-{number}",
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = DEFAULT_STOP_TIMEOUT) -> int:
+        """sends whatever's queued, then stops the sender threads
+
+        if that takes longer than timeout seconds, it gives up: anything still queued is
+        reported on the dropped hook and thrown away. returns how many events were dropped.
+        """
+        self.stop_event.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        if not self.threads:
+            return 0
+        self.abandoned.set()
+        dropped = 0
+        for lane in self.lanes:
+            count = 0
+            while True:
+                try:
+                    lane.queue.get_nowait()
+                except queue.Empty:
+                    break
+                count += 1
+            if count:
+                self.hooks.fire(STAGE_DROPPED, count=count, lane=lane.name, error="timed out stopping")
+                logger.error("Dropped {} queued events from lane {} on shutdown", count, lane.name)
+                dropped += count
+        self.threads = []
+        return dropped
+
+    def next_event(self, lane: Lane, timeout: float) -> Any:
+        """gets the next event from a lane, without waiting if we're stopping"""
+        if self.stop_event.is_set():
+            return lane.queue.get_nowait()
+        return lane.queue.get(timeout=timeout)
+
+    def sender(self, lane: Lane) -> None:
+        """fills batches from a lane's queue and sends them, until stopped and the queue's empty"""
+        while not self.abandoned.is_set() and (not self.stop_event.is_set() or not lane.queue.empty()):
+            try:
+                first = self.next_event(lane, POLL_PERIOD)
+            except queue.Empty:
+                continue
+            batch = self.make_batch(lane)
+            batch_start = time.perf_counter()
+            batch.append(first)
+            deadline = time.monotonic() + lane.linger
+            while len(batch) < lane.max_batch and batch.size < lane.max_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.next_event(lane, remaining))
+                except queue.Empty:
+                    break
+            self.hooks.fire(
+                STAGE_BATCH_CLOSED,
+                duration=time.perf_counter() - batch_start,
+                size=batch.size,
+                count=len(batch),
+                lane=lane.name,
+            )
+            try:
+                self.send(lane, batch)
+            except Exception as send_error:  # pylint: disable=broad-except
+                self.on_error(lane, send_error)
+
+
+def reserve_threads(lanes: List[Lane], total: int) -> None:
+    """gives the last (catch-all) lane whatever threads the others haven't reserved, at least one"""
+    reserved = sum(lane.threads for lane in lanes[:-1])
+    lanes[-1].threads = max(total - reserved, 1)
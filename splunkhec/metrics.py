@@ -0,0 +1,278 @@
+"""sending metrics to HEC, in the multi-measurement metric format
+
+https://docs.splunk.com/Documentation/Splunk/latest/Metrics/GetMetricsInOther#The_multiple-metric_JSON_format
+
+each data point looks like:
+
+    {"time": 1600000000.0, "event": "metric", "index": "metrics",
+     "fields": {"region": "us-west", "metric_name:cpu.idle": 90.1, "metric_name:cpu.user": 4.2}}
+
+MetricAggregator collects observations and sends one data point per set of dimensions
+every flush interval, rather than one event per observation:
+
+    aggregator = MetricAggregator(hec, interval=10, index="metrics")
+    aggregator.start()
+    aggregator.counter("requests", dimensions={"endpoint": "/login"})
+    aggregator.timing("request.duration", 0.032, dimensions={"endpoint": "/login"})
+"""
+
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+import requests
+
+if TYPE_CHECKING:
+    from . import splunkhec
+
+METRIC_PREFIX = "metric_name:"
+DEFAULT_FLUSH_INTERVAL = 10.0
+# responses worth sending the same data points again for, in the next interval
+RETRY_STATUS_CODES = (429,)
+
+# sorted (name, value) pairs, so the same dimensions in any order are the same series
+DimensionKey = Tuple[Tuple[str, str], ...]
+
+
+def make_metric_event(
+    measurements: Dict[str, float],
+    dimensions: Optional[Dict[str, Any]] = None,
+    timestamp: Optional[float] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """builds one multi-measurement data point
+
+    kwargs can be index, host, source or sourcetype
+    """
+    if not measurements:
+        raise ValueError("need at least one measurement")
+    fields: Dict[str, Any] = dict(dimensions or {})
+    for name, value in measurements.items():
+        fields[f"{METRIC_PREFIX}{name}"] = value
+    event: Dict[str, Any] = {
+        "time": time.time() if timestamp is None else timestamp,
+        "event": "metric",
+        "fields": fields,
+    }
+    for key in ("index", "host", "source", "sourcetype"):
+        if kwargs.get(key) is not None:
+            event[key] = kwargs[key]
+    return event
+
+
+def encode_metric_events(events: List[Dict[str, Any]]) -> bytes:
+    """turns data points into a HEC batch body"""
+    return b"\n".join(json.dumps(event).encode("utf-8") for event in events)
+
+
+class _Timing:
+    """running summary of timing observations"""
+
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    def add(self, value: float) -> None:
+        """adds an observation"""
+        self.count += 1
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other: "_Timing") -> None:
+        """adds another summary's observations to this one"""
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+
+class _Series:
+    """everything observed for one set of dimensions during a flush interval"""
+
+    __slots__ = ("counters", "gauges", "timings")
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, _Timing] = {}
+
+    def merge(self, newer: "_Series") -> None:
+        """adds in what was observed after this series, newer gauges win"""
+        for name, value in newer.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.gauges.update(newer.gauges)
+        for name, timing in newer.timings.items():
+            if name in self.timings:
+                self.timings[name].merge(timing)
+            else:
+                self.timings[name] = timing
+
+    def measurements(self) -> Dict[str, float]:
+        """flattens everything into metric_name -> value"""
+        measurements: Dict[str, float] = dict(self.counters)
+        measurements.update(self.gauges)
+        for name, timing in self.timings.items():
+            measurements[f"{name}.count"] = timing.count
+            measurements[f"{name}.sum"] = timing.total
+            measurements[f"{name}.min"] = timing.minimum
+            measurements[f"{name}.max"] = timing.maximum
+            measurements[f"{name}.avg"] = timing.total / timing.count
+        return measurements
+
+
+class MetricAggregator:
+    """combines counters, gauges and timings client-side and sends them every interval
+
+    - counters are summed
+    - gauges keep the last value
+    - timings are sent as name.count, name.sum, name.min, name.max and name.avg
+    """
+
+    def __init__(
+        self,
+        client: "splunkhec",
+        interval: float = DEFAULT_FLUSH_INTERVAL,
+        **kwargs: Any,
+    ) -> None:
+        """
+        optional variables
+        - index, host, source, sourcetype (added to every data point)
+        - dimensions (dict: added to every series, eg {"service": "login"})
+        - endpoint (str: defaults to /services/collector/event)
+        """
+        self.client = client
+        self.interval = interval
+        self.metadata = {key: kwargs.get(key) for key in ("index", "host", "source", "sourcetype")}
+        self.dimensions: Dict[str, Any] = dict(kwargs.get("dimensions") or {})
+        self.endpoint = kwargs.get("endpoint", "/services/collector/event")
+        self.lock = threading.Lock()
+        self.series: Dict[DimensionKey, _Series] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _get_series(self, dimensions: Optional[Dict[str, Any]]) -> _Series:
+        """finds the series for a set of dimensions, needs to be called with the lock held"""
+        key: DimensionKey = tuple(sorted((str(name), str(value)) for name, value in (dimensions or {}).items()))
+        series = self.series.get(key)
+        if series is None:
+            series = _Series()
+            self.series[key] = series
+        return series
+
+    def counter(self, name: str, value: float = 1, dimensions: Optional[Dict[str, Any]] = None) -> None:
+        """adds to a counter"""
+        with self.lock:
+            counters = self._get_series(dimensions).counters
+            counters[name] = counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float, dimensions: Optional[Dict[str, Any]] = None) -> None:
+        """sets a gauge, the last value in the interval wins"""
+        with self.lock:
+            self._get_series(dimensions).gauges[name] = value
+
+    def timing(self, name: str, value: float, dimensions: Optional[Dict[str, Any]] = None) -> None:
+        """records a duration, or any other value you want a summary of"""
+        with self.lock:
+            timings = self._get_series(dimensions).timings
+            timing = timings.get(name)
+            if timing is None:
+                timing = _Timing()
+                timings[name] = timing
+            timing.add(value)
+
+    def collect(self, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """takes everything observed so far and turns it into data points, one per series"""
+        with self.lock:
+            series, self.series = self.series, {}
+        return self._make_events(series, timestamp)
+
+    def _make_events(self, series: Dict[DimensionKey, _Series], timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """turns series into data points"""
+        if timestamp is None:
+            timestamp = time.time()
+        events = []
+        for key, values in series.items():
+            dimensions = dict(self.dimensions)
+            dimensions.update(key)
+            measurements = values.measurements()
+            if measurements:
+                events.append(make_metric_event(measurements, dimensions, timestamp, **self.metadata))
+        return events
+
+    def _restore(self, series: Dict[DimensionKey, _Series]) -> None:
+        """puts series that didn't get sent back, to go with the next interval"""
+        with self.lock:
+            for key, values in series.items():
+                newer = self.series.get(key)
+                if newer is not None:
+                    values.merge(newer)
+                self.series[key] = values
+
+    def flush(self) -> Optional[Any]:
+        """sends everything observed so far, returns the response or None if there was nothing to send
+
+        if the request fails, or the server says to try again later (429 or 5xx), what was
+        collected is kept and sent with the next interval. anything else the server rejects is
+        logged and dropped.
+        """
+        with self.lock:
+            series, self.series = self.series, {}
+        events = self._make_events(series)
+        if not events:
+            return None
+        try:
+            response = self.client.send_metrics(events, endpoint=self.endpoint)
+        except requests.exceptions.RequestException:
+            self._restore(series)
+            raise
+        if not response.ok:
+            if response.status_code in RETRY_STATUS_CODES or response.status_code >= 500:
+                self._restore(series)
+                logger.error(
+                    "Failed to send {} metric data points, will retry next interval: {} {}",
+                    len(events),
+                    response.status_code,
+                    response.text,
+                )
+            else:
+                logger.error(
+                    "Dropped {} metric data points, the server rejected them: {} {}",
+                    len(events),
+                    response.status_code,
+                    response.text,
+                )
+        return response
+
+    def _run(self) -> None:
+        """flushes every interval until stopped"""
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as flush_error:  # pylint: disable=broad-except
+                logger.error("Failed to send metrics: {}", flush_error)
+
+    def start(self) -> None:
+        """starts flushing in a background thread"""
+        if self._thread is not None:
+            raise RuntimeError("Aggregator is already running")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="splunkhec-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self, flush: bool = True) -> None:
+        """stops the background thread, and sends whatever's left unless flush is False"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
@@ -0,0 +1,122 @@
+"""a small sampling profiler, for working out where the time goes in a running forwarder
+
+every `interval` seconds it grabs the current stack of every thread and counts which
+functions are on it, so it's cheap enough to leave running for a while in production
+and it sees the worker threads as well as the main one. percentages are out of every
+stack sampled (one per thread per sweep), so they add up to 100% across all threads.
+
+    profiler = SamplingProfiler()
+    profiler.run_for(30, "/tmp/omsplunkhec.prof.txt")
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Set, Tuple
+
+DEFAULT_INTERVAL = 0.005
+
+FrameKey = Tuple[str, int, str]
+
+
+class SamplingProfiler:
+    """samples every thread's stack until stopped"""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL) -> None:
+        self.interval = interval
+        # sweeps over all the threads
+        self.samples = 0
+        # stacks looked at, one per thread per sweep
+        self.thread_samples = 0
+        # the function at the top of the stack
+        self.self_counts: Counter[FrameKey] = Counter()
+        # anywhere in the stack
+        self.total_counts: Counter[FrameKey] = Counter()
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # threads that belong to the profiler, which aren't interesting
+        self._ignored: Set[int] = set()
+
+    def sample(self) -> None:
+        """takes one sample of every thread, apart from our own"""
+        ignored = self._ignored | {threading.get_ident()}
+        for thread_ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if thread_ident in ignored:
+                continue
+            self.thread_samples += 1
+            seen = set()
+            top = True
+            current = frame
+            while current is not None:
+                code = current.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if top:
+                    self.self_counts[key] += 1
+                    top = False
+                if key not in seen:
+                    self.total_counts[key] += 1
+                    seen.add(key)
+                current = current.f_back  # type: ignore[assignment]
+        self.samples += 1
+
+    def _run(self) -> None:
+        """the sampling loop"""
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def start(self) -> None:
+        """starts sampling in a background thread"""
+        if self._thread is not None:
+            raise RuntimeError("Profiler is already running")
+        self._stop_event.clear()
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="splunkhec-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """stops sampling"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped = time.time()
+
+    def format_stats(self, limit: int = 50) -> str:
+        """returns the stats as a table, busiest functions first"""
+        elapsed = (self.stopped or time.time()) - (self.started or time.time())
+        lines = [
+            f"samples: {self.samples} thread samples: {self.thread_samples} interval: {self.interval}s elapsed: {elapsed:.2f}s",
+            "",
+            f"{'self':>8} {'self%':>7} {'total':>8} {'total%':>7}  function",
+        ]
+        samples = max(self.thread_samples, 1)
+        for key, total in self.total_counts.most_common(limit):
+            filename, lineno, name = key
+            own = self.self_counts.get(key, 0)
+            lines.append(
+                f"{own:>8} {100 * own / samples:>6.1f}% {total:>8} {100 * total / samples:>6.1f}%  {name} ({filename}:{lineno})"
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_stats(self, filename: str, limit: int = 50) -> None:
+        """writes the stats out to a file"""
+        with open(filename, "w", encoding="utf-8") as file_handle:
+            file_handle.write(self.format_stats(limit))
+
+    def run_for(self, seconds: float, filename: str) -> threading.Thread:
+        """samples for `seconds` then writes the stats to `filename`, without blocking the caller"""
+
+        def _profile() -> None:
+            self._ignored.add(threading.get_ident())
+            self.start()
+            time.sleep(seconds)
+            self.stop()
+            self.write_stats(filename)
+
+        runner = threading.Thread(target=_profile, name="splunkhec-profile-runner", daemon=True)
+        runner.start()
+        return runner
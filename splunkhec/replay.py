@@ -0,0 +1,418 @@
+"""bulk replay of log files into HEC, for backfilling after an outage
+
+handles three kinds of file:
+- raw: every line is turned into an event
+- hec: NDJSON where every line is already a HEC envelope, sent as-is
+- gzip compressed versions of either (anything ending in .gz)
+
+uncompressed files are memory mapped and split into byte ranges on line boundaries,
+then the ranges are sent in parallel. gzip files can't be split, so each one is read
+in order by a single worker, through a large buffer.
+
+progress is written to a checkpoint file as batches are accepted, so running the same
+command again after an interruption skips what's already been sent.
+
+    splunkhec-replay --server example.com:8088 --token <token> --index main /var/log/old/*.gz
+"""
+
+import argparse
+import gzip
+import io
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+import requests
+
+from . import splunkhec
+from .hooks import Hooks, STAGE_BATCH_CLOSED, STAGE_DROPPED, STAGE_RETRIED, log_hook
+
+FORMAT_RAW = "raw"
+FORMAT_HEC = "hec"
+FORMAT_AUTO = "auto"
+HEC_SUFFIXES = (".ndjson", ".json", ".jsonl")
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_BATCH_BYTES = 1024 * 1024
+DEFAULT_READ_BUFFER = 4 * 1024 * 1024
+DEFAULT_RETRIES = 5
+CHECKPOINT_INTERVAL = 1.0
+# HTTP errors that might go away if we wait, anything else in 4xx won't
+RETRY_STATUS_CODES = (429,)
+
+# (path, start, end) - end is None for gzip files, which are read to the end
+Task = Tuple[str, int, Optional[int]]
+
+
+def detect_format(path: str, file_format: str = FORMAT_AUTO) -> str:
+    """works out if a file holds raw lines or HEC envelopes"""
+    if file_format != FORMAT_AUTO:
+        return file_format
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(HEC_SUFFIXES):
+        return FORMAT_HEC
+    return FORMAT_RAW
+
+
+def split_ranges(buffer: Any, size: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """splits a buffer into (start, end) ranges of roughly chunk_size, ending just after a newline"""
+    ranges = []
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            newline = buffer.find(b"\n", end)
+            end = size if newline == -1 else newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def iter_lines(buffer: Any, start: int, end: int) -> Iterator[Tuple[bytes, int]]:
+    """yields (line, offset after the line) for the lines in buffer[start:end]"""
+    position = start
+    while position < end:
+        newline = buffer.find(b"\n", position, end)
+        if newline == -1:
+            newline = end
+        yield buffer[position:newline], newline + 1
+        position = newline + 1
+
+
+def iter_stream_lines(file_handle: Any, skip: int = 0) -> Iterator[Tuple[bytes, int]]:
+    """yields (line, offset after the line) from a stream, skipping the first `skip` bytes"""
+    offset = 0
+    for line in file_handle:
+        offset += len(line)
+        if offset <= skip:
+            continue
+        yield line.rstrip(b"\n"), offset
+
+
+class Checkpoint:
+    """keeps track of how far through each range of each file we've got
+
+    stored as JSON: {path: {"size": int, "mtime": float, "chunk_size": int, "offsets": {start: offset}}}
+
+    files are keyed on their real path, so a rerun finds them however the path was written
+    """
+
+    def __init__(self, filename: Optional[str] = None) -> None:
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.last_saved = 0.0
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if filename and os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as file_handle:
+                self.files = json.load(file_handle)
+
+    def file_state(self, path: str, chunk_size: int) -> Dict[str, Any]:
+        """returns the state for a file, starting again if the file has changed since"""
+        stat = os.stat(path)
+        path = os.path.realpath(path)
+        with self.lock:
+            state = self.files.get(path)
+            if state is None or state.get("size") != stat.st_size or state.get("mtime") != stat.st_mtime:
+                state = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "chunk_size": chunk_size,
+                    "offsets": {},
+                }
+                self.files[path] = state
+            return state
+
+    def offset(self, path: str, start: int) -> int:
+        """how far through the range that begins at start we've got"""
+        with self.lock:
+            return int(self.files[os.path.realpath(path)]["offsets"].get(str(start), start))
+
+    def update(self, path: str, start: int, offset: int) -> None:
+        """records progress through a range"""
+        with self.lock:
+            self.files[os.path.realpath(path)]["offsets"][str(start)] = offset
+        if time.time() - self.last_saved > CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self) -> None:
+        """writes the checkpoint file, if there is one"""
+        if not self.filename:
+            return
+        with self.lock:
+            temp_filename = f"{self.filename}.tmp"
+            with open(temp_filename, "w", encoding="utf-8") as file_handle:
+                json.dump(self.files, file_handle)
+            os.replace(temp_filename, self.filename)
+            self.last_saved = time.time()
+
+
+def is_retryable(error: requests.exceptions.RequestException) -> bool:
+    """works out if a failed request is worth trying again"""
+    if error.response is None:
+        return True
+    status_code = error.response.status_code
+    return status_code in RETRY_STATUS_CODES or status_code >= 500
+
+
+class Replayer:
+    """sends files to HEC, see the module docstring"""
+
+    def __init__(self, server: str, token: str, **kwargs: Any) -> None:
+        """
+        optional variables
+        - secure (bool: use https, default True)
+        - index, sourcetype, host, source (metadata added to raw events)
+        - file_format (raw, hec or auto)
+        - threads (int: parallel senders)
+        - chunk_size (int: bytes per range when splitting files)
+        - batch_bytes (int: roughly how big each request gets)
+        - retries (int: attempts per batch before giving up)
+        - checkpoint (str: filename to keep progress in)
+        - endpoint (str: defaults to /services/collector/event)
+        - auto_extract_timestamp (bool: have splunk pull timestamps out of events that don't have
+          a time, rather than indexing them at the time they arrive, default True)
+        - hooks (splunkhec.hooks.Hooks)
+        """
+        self.server = server
+        self.token = token
+        self.secure = kwargs.get("secure", True)
+        self.file_format = kwargs.get("file_format", FORMAT_AUTO)
+        self.threads = int(kwargs.get("threads", os.cpu_count() or 4))
+        self.chunk_size = int(kwargs.get("chunk_size", DEFAULT_CHUNK_SIZE))
+        self.batch_bytes = int(kwargs.get("batch_bytes", DEFAULT_BATCH_BYTES))
+        self.retries = int(kwargs.get("retries", DEFAULT_RETRIES))
+        self.endpoint = kwargs.get("endpoint", "/services/collector/event")
+        # raw lines don't have a time, without this a backfill would index them all as now
+        if kwargs.get("auto_extract_timestamp", True) and "auto_extract_timestamp" not in self.endpoint:
+            separator = "&" if "?" in self.endpoint else "?"
+            self.endpoint = f"{self.endpoint}{separator}auto_extract_timestamp=true"
+        self.hooks = kwargs.get("hooks") or Hooks()
+        self.checkpoint = Checkpoint(kwargs.get("checkpoint"))
+        self.metadata = {
+            key: kwargs[key] for key in ("index", "sourcetype", "host", "source") if kwargs.get(key) is not None
+        }
+        self.local = threading.local()
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self.counter_lock = threading.Lock()
+
+    def client(self) -> splunkhec:
+        """one client per thread, so each keeps its own connection"""
+        if not hasattr(self.local, "client"):
+            self.local.client = splunkhec(
+                server=self.server,
+                token=self.token,
+                secure=self.secure,
+                hooks=self.hooks,
+            )
+        client: splunkhec = self.local.client
+        return client
+
+    def envelope_suffix(self, path: str) -> bytes:
+        """the metadata for raw events, encoded once per file rather than once per event"""
+        metadata = dict(self.metadata)
+        metadata.setdefault("source", path)
+        return b"," + json.dumps(metadata).encode("utf-8")[1:]
+
+    def send(self, body: bytes, count: int) -> None:
+        """posts one batch, retrying connection problems, 429s and 5xx with backoff
+
+        other errors (bad token, malformed events) won't get better by trying again, so they're dropped straight away
+        """
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.client().do_post_request(
+                    endpoint=self.endpoint,
+                    body=body,
+                    count=count,
+                    retrying=True,
+                )
+                response.raise_for_status()
+                break
+            except requests.exceptions.RequestException as error_message:
+                if attempt == self.retries or not is_retryable(error_message):
+                    self.hooks.fire(STAGE_DROPPED, size=len(body), count=count, error=str(error_message))
+                    raise
+                self.hooks.fire(STAGE_RETRIED, size=len(body), count=count, error=str(error_message))
+                logger.warning("Send failed (attempt {}/{}): {}", attempt, self.retries, error_message)
+                time.sleep(min(2**attempt, 30))
+        with self.counter_lock:
+            self.events_sent += count
+            self.bytes_sent += len(body)
+
+    def send_lines(self, path: str, start: int, offset: int, lines: Iterator[Tuple[bytes, int]]) -> None:
+        """batches lines up, sends them and records progress against the range that begins at start
+
+        offset is where we're resuming from within the range
+        """
+        file_format = detect_format(path, self.file_format)
+        suffix = self.envelope_suffix(path)
+        batch: List[bytes] = []
+        batch_size = 0
+        batch_start = time.perf_counter()
+        for line, offset in lines:
+            line = line.rstrip(b"\r")
+            if not line.strip():
+                continue
+            if file_format == FORMAT_HEC:
+                event = line
+            else:
+                event = b'{"event":' + json.dumps(line.decode("utf-8", errors="replace")).encode("utf-8") + suffix
+            batch.append(event)
+            batch_size += len(event)
+            if batch_size >= self.batch_bytes:
+                self.hooks.fire(
+                    STAGE_BATCH_CLOSED,
+                    duration=time.perf_counter() - batch_start,
+                    size=batch_size,
+                    count=len(batch),
+                )
+                self.send(b"\n".join(batch), len(batch))
+                self.checkpoint.update(path, start, offset)
+                batch = []
+                batch_size = 0
+                batch_start = time.perf_counter()
+        if batch:
+            self.hooks.fire(
+                STAGE_BATCH_CLOSED,
+                duration=time.perf_counter() - batch_start,
+                size=batch_size,
+                count=len(batch),
+            )
+            self.send(b"\n".join(batch), len(batch))
+        self.checkpoint.update(path, start, offset)
+
+    def replay_range(self, task: Task) -> None:
+        """sends one range of a file"""
+        path, start, end = task
+        resume_from = self.checkpoint.offset(path, start)
+        if end is None:
+            with gzip.open(path, "rb") as compressed:
+                with io.BufferedReader(compressed, buffer_size=DEFAULT_READ_BUFFER) as file_handle:
+                    self.send_lines(path, start, resume_from, iter_stream_lines(file_handle, skip=resume_from))
+            return
+        if resume_from >= end:
+            return
+        with open(path, "rb") as file_handle:
+            with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                self.send_lines(path, start, resume_from, iter_lines(buffer, resume_from, end))
+
+    def tasks(self, paths: List[str]) -> List[Task]:
+        """breaks the files up into work for the thread pool"""
+        tasks: List[Task] = []
+        for path in paths:
+            state = self.checkpoint.file_state(path, self.chunk_size)
+            if path.endswith(".gz"):
+                tasks.append((path, 0, None))
+                continue
+            size = int(state["size"])
+            if size == 0:
+                continue
+            with open(path, "rb") as file_handle:
+                with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for start, end in split_ranges(buffer, size, int(state["chunk_size"])):
+                        tasks.append((path, start, end))
+        return tasks
+
+    def replay(self, paths: List[str]) -> None:
+        """sends all the files, raising the first error any worker hits"""
+        tasks = self.tasks(paths)
+        logger.info("Replaying {} files in {} ranges with {} threads", len(paths), len(tasks), self.threads)
+        start_time = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                for _ in executor.map(self.replay_range, tasks):
+                    pass
+        finally:
+            self.checkpoint.save()
+        elapsed = max(time.time() - start_time, 0.001)
+        logger.info(
+            "Sent {} events, {} bytes in {:.1f}s ({:.1f} MB/s)",
+            self.events_sent,
+            self.bytes_sent,
+            elapsed,
+            self.bytes_sent / elapsed / 1024 / 1024,
+        )
+
+
+def main() -> None:
+    """entry point for splunkhec-replay"""
+    parser = argparse.ArgumentParser(description="bulk replay files into Splunk HEC")
+    parser.add_argument("files", nargs="+", help="files to send, .gz files are decompressed")
+    parser.add_argument("--server", required=True, help="http event collector hostname, eg example.com:8088")
+    parser.add_argument("--token", default=os.getenv("SPLUNK_HEC_TOKEN"), help="http event collector token")
+    parser.add_argument("--insecure", action="store_true", help="use http instead of https")
+    parser.add_argument("--index")
+    parser.add_argument("--sourcetype")
+    parser.add_argument("--host")
+    parser.add_argument("--source", help="defaults to the filename")
+    parser.add_argument(
+        "--format",
+        dest="file_format",
+        choices=(FORMAT_AUTO, FORMAT_RAW, FORMAT_HEC),
+        default=FORMAT_AUTO,
+        help="auto treats .ndjson/.json/.jsonl as HEC envelopes and everything else as raw lines",
+    )
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE, help="bytes per range when splitting files")
+    parser.add_argument("--batch_bytes", type=int, default=DEFAULT_BATCH_BYTES, help="roughly how big each request gets")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--checkpoint", help="file to keep progress in, so an interrupted replay can resume")
+    parser.add_argument(
+        "--auto_extract_timestamp",
+        action="store_true",
+        default=True,
+        help="ask splunk to pull timestamps out of raw events rather than using the time they arrive (the default)",
+    )
+    parser.add_argument(
+        "--no_auto_extract_timestamp",
+        dest="auto_extract_timestamp",
+        action="store_false",
+        help="index raw events at the time they arrive",
+    )
+    parser.add_argument("--trace", action="store_true", help="log timings and sizes at every stage")
+    args = parser.parse_args()
+
+    if not args.token:
+        parser.error("need a token, either --token or SPLUNK_HEC_TOKEN")
+
+    hooks = Hooks()
+    if args.trace:
+        hooks.register("*", log_hook)
+
+    replayer = Replayer(
+        server=args.server,
+        token=args.token,
+        secure=not args.insecure,
+        index=args.index,
+        sourcetype=args.sourcetype,
+        host=args.host,
+        source=args.source,
+        file_format=args.file_format,
+        threads=args.threads,
+        chunk_size=args.chunk_size,
+        batch_bytes=args.batch_bytes,
+        retries=args.retries,
+        checkpoint=args.checkpoint,
+        auto_extract_timestamp=args.auto_extract_timestamp,
+        hooks=hooks,
+    )
+    try:
+        replayer.replay(args.files)
+    except requests.exceptions.RequestException as error_message:
+        logger.error("Replay stopped: {}", error_message)
+        if args.checkpoint:
+            logger.error("Run the same command again to resume from {}", args.checkpoint)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
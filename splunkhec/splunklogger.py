@@ -1,9 +1,10 @@
 #!python3
 """ dirty little logger for pushing from loguru to splunk HEC """
 
+import atexit
 from os import getenv
 import time
-from typing import Any, Optional
+from typing import Any, List, Optional
 import sys
 
 try:
@@ -16,6 +17,10 @@ try:
 except ImportError as error_message:
     sys.exit(f"Couldn't import loguru, `python3 -m pip install loguru` would be handy. Error: {error_message}") #pylint: disable=line-too-long
 
+from .events import EventBatch, HecEvent
+from .hooks import Hooks, STAGE_DROPPED
+from .lanes import DEFAULT_STOP_TIMEOUT, Lane, PriorityLanes
+
 
 class SplunkLogger():
     """ this can help you to log directly to splunk HEC """
@@ -24,6 +29,8 @@ class SplunkLogger():
                  token: str,
                  sourcetype: str="unknown",
                  index_name: str="main",
+                 lanes: Optional[List[Lane]]=None,
+                 hooks: Optional[Hooks]=None,
                  ):
         """using this
 from splunklogger import SplunkLogger
@@ -34,12 +41,31 @@ splunklogger = SplunkLogger(endpoint="https://localhost:8088/services/collector"
                             index_name="my_logging_index",
                             )
 logger.add(splunklogger.splunk_logger)
+
+without lanes every message is sent as it's logged, one request each. with lanes, messages
+are queued by level and sent in batches from background threads, so errors can skip
+past a backlog of debug messages. when the bulk lane's queue is full its oldest messages
+are dropped (and reported on the dropped hook) rather than holding up logging:
+
+splunklogger = SplunkLogger(...,
+                            lanes=[Lane("urgent", min_level=40, max_batch=10, linger=0.05),
+                                   Lane("bulk", max_batch=500, linger=2.0, threads=2)],
+                            )
 """
         self.endpoint = endpoint
         self.token = token
         self.sourcetype = sourcetype
         self.index_name = index_name
         self.event_formatter = self.default_event_formatter
+        self.lanes: Optional[PriorityLanes] = None
+        if lanes:
+            self.lanes = PriorityLanes(lanes,
+                                       make_batch=self.make_batch,
+                                       send=self.send_lane_batch,
+                                       hooks=hooks,
+                                       )
+            self.lanes.start()
+            atexit.register(self.stop)
 
     def send_single_event(self,
                           **kwargs: Any,
@@ -48,15 +74,55 @@ logger.add(splunklogger.splunk_logger)
         if 'event' not in kwargs:
             raise ValueError("need to have at least an event value")
         headers = {
-            'Authorization' : f'Splunk {self.token}'
+            'Authorization' : f'Splunk {self.token}',
+            'Content-Type' : 'application/json',
+        }
+        event = HecEvent(**kwargs)
+        if not isinstance(event.event, str):
+            event.event = str(event.event)
+        req = requests.post(url=self.endpoint, data=event.encode(), headers=headers, timeout=30)
+        req.raise_for_status()
+        return req
+
+    def make_batch(self, lane: Lane) -> EventBatch: # pylint: disable=unused-argument
+        """ makes an empty batch for a lane to fill """
+        return EventBatch(index=self.index_name, sourcetype=self.sourcetype)
+
+    def send_batch(self, batch: EventBatch) -> requests.Response:
+        """ submits a batch of events in one request """
+        headers = {
+            'Authorization' : f'Splunk {self.token}',
+            'Content-Type' : 'application/json',
         }
-        payload = kwargs
-        if not isinstance(payload['event'], str):
-            payload['event'] = str(payload['event'])
-        req = requests.post(url=self.endpoint, json=payload, headers=headers, timeout=30)
+        req = requests.post(url=self.endpoint, data=batch.encode(), headers=headers, timeout=30)
         req.raise_for_status()
         return req
 
+    def send_lane_batch(self, lane: Lane, batch: EventBatch) -> None:
+        """ sends a batch from a lane, retrying until it works like splunk_logger does,
+            or until stop() gives up waiting """
+        assert self.lanes is not None
+        while True:
+            try:
+                self.send_batch(batch)
+                return
+            except Exception as log_error: # pylint: disable=broad-except
+                print(f"Failed to send {len(batch)} events from lane {lane.name}, error: {log_error}")
+                if self.lanes.abandoned.wait(5):
+                    self.lanes.hooks.fire(STAGE_DROPPED,
+                                          size=batch.size,
+                                          count=len(batch),
+                                          lane=lane.name,
+                                          error=str(log_error),
+                                          )
+                    return
+
+    def stop(self, timeout: Optional[float]=DEFAULT_STOP_TIMEOUT) -> None:
+        """ sends anything still queued in the lanes and stops their threads,
+            giving up and dropping what's left after timeout seconds """
+        if self.lanes is not None:
+            self.lanes.stop(timeout)
+
     @classmethod
     def default_event_formatter(cls, event_text: str) -> str:
         """ this is a default passthrough to allow for text formatting
@@ -65,7 +131,12 @@ logger.add(splunklogger.splunk_logger)
 
     def splunk_logger(self, event_text: str) -> bool:
         """ makes a callable for loguru to send to splunk """
+        record = getattr(event_text, 'record', None)
         event_text = self.event_formatter(event_text)
+        if self.lanes is not None:
+            level = record["level"].no if record else None
+            self.lanes.put(event_text.strip(), level=level)
+            return True
         try:
             self.send_single_event(event=event_text.strip(),
                                    index=self.index_name,
@@ -0,0 +1,188 @@
+"""streaming request bodies, so big batches don't have to be built in memory first
+
+an EventFeeder pulls events from an iterator in a background thread. a BodyStream takes
+events from the feeder, encodes them (and gzips them if asked) and yields the bytes in
+chunks, which requests sends with chunked transfer encoding as they're produced. whenever
+the feeder has nothing waiting, whatever's buffered is flushed onto the wire, so events
+go out as they arrive. a BodyStream stops at a byte, event count or time limit, even if the
+iterator has stalled, and the rest of the events go in the next request. see
+splunkhec.send_stream for the usual way to use it.
+"""
+
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+
+from .events import EventBatch
+
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_MAX_EVENTS = 1000000
+DEFAULT_MAX_SECONDS = 30.0
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_QUEUE = 1000
+# gzip framing for zlib
+GZIP_WBITS = 31
+# how often a blocked feeder checks if it's been stopped
+POLL_PERIOD = 0.2
+
+# put on the queue when the iterator runs out
+END_OF_EVENTS = object()
+
+
+class EventFeeder:
+    """takes events from an iterator in a background thread and queues them
+
+    this way a slow iterator can't hold a request open past its time limit. if the iterator
+    raises, the exception is kept in error and the feed ends.
+    """
+
+    def __init__(self, events: Iterable[Any], max_queue: int = DEFAULT_MAX_QUEUE) -> None:
+        self.events = events
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self.exhausted = False
+        self.error: Optional[Exception] = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="splunkhec-stream-feeder", daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        """queues an item, returns False if we've been stopped while waiting for space"""
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=POLL_PERIOD)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        """the feeder thread"""
+        try:
+            for event in self.events:
+                if not self._put(event):
+                    return
+        except Exception as feed_error:  # pylint: disable=broad-except
+            self.error = feed_error
+        self._put(END_OF_EVENTS)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """the next event, or END_OF_EVENTS. raises queue.Empty if nothing arrives in time"""
+        if self.exhausted:
+            return END_OF_EVENTS
+        if timeout is not None and timeout <= 0:
+            event = self.queue.get_nowait()
+        else:
+            event = self.queue.get(timeout=timeout)
+        if event is END_OF_EVENTS:
+            self.exhausted = True
+        return event
+
+    def stop(self) -> None:
+        """stops taking events from the iterator"""
+        self._stop_event.set()
+
+
+class BodyStream:
+    """the body of one streamed request
+
+    afterwards, raw_bytes/sent_bytes/count say how much went, and exhausted is True if
+    the feeder ran out of events.
+    """
+
+    def __init__(
+        self,
+        first: Any,
+        feeder: EventFeeder,
+        encoder: EventBatch,
+        **kwargs: Any,
+    ) -> None:
+        """
+        - first (the first event, already taken from the feeder)
+        - feeder (where the rest come from)
+        - encoder (an EventBatch holding the shared metadata, see EventBatch.encode_event)
+
+        optional variables
+        - max_bytes (int: uncompressed bytes before the request is closed)
+        - max_events (int: events before the request is closed)
+        - max_seconds (float: seconds before the request is closed)
+        - compress (bool: gzip the body)
+        - chunk_size (int: most bytes buffered before they're handed to requests)
+        """
+        self.first = first
+        self.feeder = feeder
+        self.encoder = encoder
+        self.max_bytes = int(kwargs.get("max_bytes", DEFAULT_MAX_BYTES))
+        self.max_events = int(kwargs.get("max_events", DEFAULT_MAX_EVENTS))
+        self.max_seconds = float(kwargs.get("max_seconds", DEFAULT_MAX_SECONDS))
+        self.compress = bool(kwargs.get("compress", False))
+        self.chunk_size = int(kwargs.get("chunk_size", DEFAULT_CHUNK_SIZE))
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.count = 0
+        self.encode_time = 0.0
+        self.compress_time = 0.0
+        self.exhausted = False
+        self._compressor: Optional[Any] = None
+
+    def _output(self, data: bytes, mode: int = zlib.Z_NO_FLUSH) -> bytes:
+        """compresses data if we're doing that, and keeps count of what's sent
+
+        mode is Z_SYNC_FLUSH to push everything so far out of the compressor, or Z_FINISH at the end
+        """
+        if self._compressor is not None:
+            compress_start = time.perf_counter()
+            data = self._compressor.compress(data)
+            if mode != zlib.Z_NO_FLUSH:
+                data += self._compressor.flush(mode)
+            self.compress_time += time.perf_counter() - compress_start
+        self.sent_bytes += len(data)
+        return data
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.compress:
+            self._compressor = zlib.compressobj(wbits=GZIP_WBITS)
+        deadline = time.monotonic() + self.max_seconds
+        buffer = []
+        buffered = 0
+        event = self.first
+        while True:
+            encode_start = time.perf_counter()
+            encoded = self.encoder.encode_event(event)
+            if self.count:
+                encoded = b"\n" + encoded
+            self.encode_time += time.perf_counter() - encode_start
+            buffer.append(encoded)
+            buffered += len(encoded)
+            self.raw_bytes += len(encoded)
+            self.count += 1
+            if buffered >= self.chunk_size:
+                chunk = self._output(b"".join(buffer))
+                buffer = []
+                buffered = 0
+                # an empty chunk would end the request early
+                if chunk:
+                    yield chunk
+            if self.raw_bytes >= self.max_bytes or self.count >= self.max_events or time.monotonic() >= deadline:
+                break
+            try:
+                event = self.feeder.get(timeout=0)
+            except queue.Empty:
+                # nothing waiting, so send what we've got before waiting for more
+                if buffer:
+                    chunk = self._output(b"".join(buffer), zlib.Z_SYNC_FLUSH)
+                    buffer = []
+                    buffered = 0
+                    if chunk:
+                        yield chunk
+                try:
+                    event = self.feeder.get(timeout=deadline - time.monotonic())
+                except queue.Empty:
+                    break
+            if event is END_OF_EVENTS:
+                self.exhausted = True
+                break
+        chunk = self._output(b"".join(buffer), zlib.Z_FINISH)
+        if chunk:
+            yield chunk
@@ -13,4 +13,10 @@ def validate_token_format(token: str) -> bool:
         raise ValueError("Token is not a valid UUID") # pylint: disable=raise-missing-from
     return True
 
+def mask_token(token: str) -> str:
+    """ hides all but the last few characters of a token, for printing """
+    if len(token) <= 4:
+        return '*' * len(token)
+    return '*' * (len(token) - 4) + token[-4:]
+
 DEFAULT_ENDPOINT = '/services/collector'
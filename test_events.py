@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+""" tests splunkhec.events """
+
+import json
+import tracemalloc
+from typing import Iterator
+
+from splunkhec.events import EventBatch, HecEvent
+
+def test_hecevent_to_dict() -> None:
+    """ unset values are left out """
+    event = HecEvent("hello", time=1.5, index="main")
+    assert event.to_dict() == {"event": "hello", "time": 1.5, "index": "main"}
+    assert json.loads(event.encode()) == event.to_dict()
+
+def test_eventbatch_encode() -> None:
+    """ shared metadata ends up on every event, overrides only on the one event """
+    batch = EventBatch(host="web01", sourcetype="syslog", index="main")
+    batch.append("first")
+    batch.append(HecEvent({"nested": True}, time=2.0, index="other", fields={"a": "b"}))
+    batch.append("third", time=3.0)
+    body = batch.encode()
+    decoded = [json.loads(line) for line in body.split(b"\n")]
+    assert decoded == [
+        {"event": "first", "host": "web01", "sourcetype": "syslog", "index": "main"},
+        {"event": {"nested": True}, "time": 2.0, "fields": {"a": "b"}, "host": "web01", "sourcetype": "syslog", "index": "other"},
+        {"event": "third", "time": 3.0, "host": "web01", "sourcetype": "syslog", "index": "main"},
+    ]
+    assert [event.to_dict() for event in batch] == decoded
+    assert batch[-2].index == "other"
+    assert b'": ' not in body and b', "' not in body
+
+def test_eventbatch_size() -> None:
+    """ the tracked size matches what goes on the wire """
+    batch = EventBatch(source="test")
+    assert batch.size == 0
+    for i in range(50):
+        assert batch.append(f"event {i}") == len(batch.encode())
+    batch.clear()
+    assert not batch
+    assert batch.size == 0
+
+def test_eventbatch_memory() -> None:
+    """ a batch of syslog lines should take less memory than a dict per line """
+    def lines() -> Iterator[str]:
+        for i in range(20000):
+            yield f"Oct 19 12:00:00 web01 sshd[{i}]: Accepted publickey for user{i} from 10.0.0.{i % 255} port 22"
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        batch = EventBatch(index="main", sourcetype="syslog", host="web01")
+        for line in lines():
+            batch.append(line)
+        batch_size = tracemalloc.get_traced_memory()[0] - start
+
+        start = tracemalloc.get_traced_memory()[0]
+        payload = [
+            {"event": line, "index": "main", "sourcetype": "syslog", "host": "web01"}
+            for line in lines()
+        ]
+        dict_size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    assert len(batch) == len(payload)
+    assert batch_size < dict_size
+    # the shared metadata isn't kept per event, so the batch is smaller than its body
+    assert batch_size < batch.size
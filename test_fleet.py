@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+""" tests splunkhec.fleet and the health checks """
+
+import sys
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+import requests
+import requests_mock
+
+from splunkhec import splunkhec
+from splunkhec.fleet import CheckResult, HealthCache, check_fleet, main
+
+HEALTH = "/services/collector/health"
+
+def test_check_fleet() -> None:
+    """ each pair gets mapped through STATUS_CODE_MAP, failures don't stop the rest """
+    token = str(uuid4())
+    with requests_mock.mock() as mock:
+        mock.get(f"https://good.example.com:8088{HEALTH}", status_code=200)
+        mock.get(f"https://full.example.com:8088{HEALTH}", status_code=503)
+        mock.get(f"https://weird.example.com:8088{HEALTH}", status_code=418)
+        mock.get(f"https://down.example.com:8088{HEALTH}", exc=requests.exceptions.ConnectTimeout)
+        cache = HealthCache()
+        servers = ["good", "full", "weird", "down"]
+        results = check_fleet(
+            [(f"{server}.example.com:8088", token) for server in servers],
+            cache=cache,
+        )
+        assert mock.call_count == 4
+        assert all(request.headers["Authorization"] == f"Splunk {token}" for request in mock.request_history)
+    assert [result.result for result in results] == [True, False, False, False]
+    assert [result.status_code for result in results] == [200, 503, 418, None]
+    assert results[1].description == "HEC is unhealthy, queues are full"
+    assert results[0].to_dict()["token"].endswith(token[-4:])
+    assert token not in str(results[0].to_dict())
+
+    cached = cache.get("https://good.example.com:8088/", token)
+    assert cached is not None and cached.result
+
+def test_cache_ttl() -> None:
+    """ stale results aren't returned """
+    cache = HealthCache(ttl=10)
+    result = CheckResult("example.com:8088", "token", True, 200, "ok", 0.1)
+    cache.set(result)
+    assert cache.get("example.com:8088", "token") is result
+    result.checked_at -= 11
+    assert cache.get("example.com:8088", "token") is None
+
+def test_client_health() -> None:
+    """ is_healthy uses the health endpoint, cached_health doesn't make a request """
+    token = str(uuid4())
+    cache = HealthCache()
+    hec = splunkhec(server="example.com:8088", token=token, health_cache=cache)
+    with requests_mock.mock() as mock:
+        mock.get(f"https://example.com:8088{HEALTH}", status_code=400)
+        assert not hec.is_healthy()
+        assert hec.is_healthy(verbose=True)["description"] == "Invalid HEC token"
+        assert hec.cached_health() is None
+        check_fleet([("example.com:8088", token)], cache=cache)
+        calls = mock.call_count
+        assert hec.cached_health() is False
+        assert mock.call_count == calls
+
+def test_main_bad_pairs_line(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    """ a pairs line without a comma is a usage error that says where it is """
+    pairs = tmp_path / "pairs.txt"
+    pairs.write_text(f"# server,token\nidx1.example.com:8088,{uuid4()}\nidx2.example.com:8088\n")
+    monkeypatch.setattr(sys, "argv", ["splunkhec-fleetcheck", "--pairs", str(pairs)])
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 2
+    assert f"{pairs} line 3: expected server,token" in capsys.readouterr().err
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+""" tests splunkhec.hooks and the client firing them """
+
+import re
+import threading
+import time
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import pytest
+import requests
+import requests_mock
+
+from splunkhec import splunkhec
+from splunkhec.hooks import (
+    Hooks,
+    STAGE_DROPPED,
+    STAGE_ENCODED,
+    STAGE_REQUEST_SENT,
+    STAGE_RESPONSE_RECEIVED,
+    STAGES,
+)
+from splunkhec.profiling import SamplingProfiler
+
+URLMATCHER = re.compile('.*')
+
+def test_register_unknown_stage() -> None:
+    """ unknown stages should be rejected """
+    hooks = Hooks()
+    with pytest.raises(ValueError):
+        hooks.register("nope", print)
+
+def test_register_all_stages() -> None:
+    """ "*" registers against everything, and unregisters from everything """
+    hooks = Hooks()
+    seen: List[Dict[str, Any]] = []
+    hooks.register("*", seen.append)
+    for stage in STAGES:
+        assert hooks.enabled(stage)
+    hooks.unregister("*", seen.append)
+    for stage in STAGES:
+        assert not hooks.enabled(stage)
+
+def test_broken_hook_is_ignored() -> None:
+    """ a callback raising shouldn't stop the rest """
+    hooks = Hooks()
+    seen: List[Dict[str, Any]] = []
+    def broken(info: Dict[str, Any]) -> None:
+        raise RuntimeError(info)
+    hooks.register(STAGE_ENCODED, broken)
+    hooks.register(STAGE_ENCODED, seen.append)
+    hooks.fire(STAGE_ENCODED, size=10)
+    assert seen[0]["stage"] == STAGE_ENCODED
+    assert seen[0]["size"] == 10
+
+def test_client_fires_hooks() -> None:
+    """ the client should fire encoded, request_sent and response_received with sizes """
+    hooks = Hooks()
+    seen: List[Dict[str, Any]] = []
+    hooks.register("*", seen.append)
+    with requests_mock.mock() as mock:
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()), hooks=hooks)
+        mock.post(URLMATCHER, text='{"text":"Success","code":0}', status_code=200)
+        assert hec.send_test_event()
+    stages = [info["stage"] for info in seen]
+    assert stages == [STAGE_ENCODED, STAGE_REQUEST_SENT, STAGE_RESPONSE_RECEIVED]
+    assert seen[0]["size"] == len(mock.last_request.body)
+    assert seen[2]["status_code"] == 200
+    assert seen[2]["duration"] >= 0
+
+def test_client_fires_dropped() -> None:
+    """ a request that fails outright should be reported as dropped """
+    hooks = Hooks()
+    seen: List[Dict[str, Any]] = []
+    hooks.register("*", seen.append)
+    with requests_mock.mock() as mock:
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()), hooks=hooks)
+        mock.post(URLMATCHER, exc=requests.exceptions.ConnectTimeout)
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            hec.do_post_request(body=b'{"event":"hello"}', count=1)
+    stages = [info["stage"] for info in seen]
+    assert stages == [STAGE_REQUEST_SENT, STAGE_DROPPED]
+    assert seen[1]["size"] == len(b'{"event":"hello"}')
+    assert seen[1]["count"] == 1
+
+def test_send_stream_fires_sizes() -> None:
+    """ a streamed request reports its size and count once it's been sent """
+    hooks = Hooks()
+    seen: List[Dict[str, Any]] = []
+    hooks.register(STAGE_REQUEST_SENT, seen.append)
+    bodies: List[bytes] = []
+
+    def callback(request: Any, context: Any) -> str:
+        bodies.append(b"".join(request.body))
+        return '{"text":"Success","code":0}'
+
+    with requests_mock.mock() as mock:
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()), hooks=hooks)
+        mock.post(URLMATCHER, text=callback, status_code=200)
+        hec.send_stream((f"event {i}" for i in range(50)))
+    assert seen[0]["count"] == 50
+    assert seen[0]["size"] == len(bodies[0])
+
+def test_sampling_profiler(tmp_path: Any) -> None:
+    """ samples something and writes a stats file """
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    for _ in range(100):
+        if profiler.samples >= 5:
+            break
+        time.sleep(0.01)
+    profiler.stop()
+    filename = tmp_path / "stats.txt"
+    profiler.write_stats(str(filename))
+    assert filename.read_text().startswith("samples: ")
+
+def test_sampling_profiler_percentages() -> None:
+    """ with several threads busy, no function can be on more than 100% of the stacks """
+    stop = threading.Event()
+    workers = [threading.Thread(target=stop.wait, daemon=True) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    profiler = SamplingProfiler()
+    for _ in range(5):
+        profiler.sample()
+    stop.set()
+    for worker in workers:
+        worker.join()
+    assert profiler.thread_samples >= 5 * len(workers)
+    for line in profiler.format_stats().splitlines()[3:]:
+        own_percent, total_percent = line.split()[1], line.split()[3]
+        assert float(own_percent.rstrip("%")) <= 100
+        assert float(total_percent.rstrip("%")) <= 100
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+""" tests splunkhec.lanes """
+
+import io
+import re
+import threading
+import time
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Tuple
+from uuid import uuid4
+
+import requests_mock
+
+from splunkhec.events import EventBatch
+from splunkhec.hooks import STAGE_DROPPED, Hooks
+from splunkhec.lanes import Lane, PriorityLanes, reserve_threads
+from splunkhec.splunklogger import SplunkLogger
+
+URLMATCHER = re.compile('.*')
+
+def make_lanes() -> List[Lane]:
+    """ an urgent lane and a catch-all """
+    return [
+        Lane("urgent", max_severity=3, min_level=40, pattern="FATAL", max_batch=5, linger=0.01),
+        Lane("bulk", max_batch=1000, linger=0.5),
+    ]
+
+def test_routing() -> None:
+    """ any of severity, level or pattern picks the urgent lane """
+    lanes = PriorityLanes(make_lanes(), make_batch=lambda lane: EventBatch(), send=print)
+    assert lanes.route(severity=2).name == "urgent"
+    assert lanes.route(severity=6).name == "bulk"
+    assert lanes.route(level=50).name == "urgent"
+    assert lanes.route(level=10).name == "bulk"
+    assert lanes.put("something FATAL happened").name == "urgent"
+    assert lanes.route().name == "bulk"
+
+def test_reserve_threads() -> None:
+    """ the catch-all lane gets what's left """
+    lanes = make_lanes()
+    lanes[0].threads = 3
+    reserve_threads(lanes, 10)
+    assert lanes[-1].threads == 7
+    reserve_threads(lanes, 2)
+    assert lanes[-1].threads == 1
+
+def test_urgent_skips_blocked_bulk() -> None:
+    """ urgent events get sent while the bulk sender is stuck """
+    sent: List[Tuple[str, int]] = []
+    bulk_blocked = threading.Event()
+    urgent_sent = threading.Event()
+
+    def send(lane: Lane, batch: EventBatch) -> None:
+        if lane.name == "bulk":
+            bulk_blocked.wait(5)
+        else:
+            urgent_sent.set()
+        sent.append((lane.name, len(batch)))
+
+    lanes = PriorityLanes(make_lanes(), make_batch=lambda lane: EventBatch(), send=send)
+    lanes.start()
+    for i in range(100):
+        lanes.put(f"debug {i}", severity=7)
+    lanes.put("disk on fire", severity=2)
+    assert urgent_sent.wait(2)
+    assert sent == [("urgent", 1)]
+    bulk_blocked.set()
+    lanes.stop()
+    assert sum(count for name, count in sent if name == "bulk") == 100
+
+def test_stop_gives_up() -> None:
+    """ stop() doesn't hang when the server's unreachable, and reports what it drops """
+    dropped: List[Dict[str, Any]] = []
+    hooks = Hooks()
+    hooks.register(STAGE_DROPPED, dropped.append)
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, status_code=503)
+        splunklogger = SplunkLogger(
+            endpoint="https://example.com:8088/services/collector",
+            token=str(uuid4()),
+            lanes=[Lane("bulk", max_batch=5, linger=0.01, max_queue=100)],
+            hooks=hooks,
+        )
+        for i in range(20):
+            splunklogger.splunk_logger(f"message {i}")
+        start = time.monotonic()
+        with redirect_stdout(io.StringIO()):
+            splunklogger.stop(timeout=0.3)
+        assert time.monotonic() - start < 1
+    assert sum(info["count"] for info in dropped) >= 15
+
+def test_full_bulk_lane_doesnt_block_urgent() -> None:
+    """ with the bulk queue full and its sender stuck, urgent events still get queued and sent """
+    dropped: List[Dict[str, Any]] = []
+    hooks = Hooks()
+    hooks.register(STAGE_DROPPED, dropped.append)
+    bulk_blocked = threading.Event()
+    urgent_sent = threading.Event()
+
+    def send(lane: Lane, batch: EventBatch) -> None:
+        if lane.name == "bulk":
+            bulk_blocked.wait(5)
+        else:
+            urgent_sent.set()
+
+    lanes = PriorityLanes(
+        [
+            Lane("urgent", max_severity=3, max_batch=5, linger=0.01),
+            Lane("bulk", max_batch=5, linger=0.01, max_queue=20),
+        ],
+        make_batch=lambda lane: EventBatch(),
+        send=send,
+        hooks=hooks,
+    )
+    lanes.start()
+    for i in range(200):
+        lanes.put(f"debug {i}", severity=7)
+    lanes.put("disk on fire", severity=2)
+    assert urgent_sent.wait(2)
+    bulk_blocked.set()
+    lanes.stop()
+    assert lanes.lanes[1].dropped >= 200 - 20 - 5
+    assert sum(info["count"] for info in dropped) == lanes.lanes[1].dropped
+    assert all(info["lane"] == "bulk" for info in dropped)
+
+def test_overflow_drop_new() -> None:
+    """ drop_new keeps what's queued and throws away the new event """
+    lanes = PriorityLanes(
+        [Lane("only", max_queue=2, overflow="drop_new")],
+        make_batch=lambda lane: EventBatch(),
+        send=print,
+    )
+    for i in range(5):
+        lanes.put(f"event {i}")
+    queued = [lanes.lanes[0].queue.get_nowait() for _ in range(2)]
+    assert queued == ["event 0", "event 1"]
+    assert lanes.lanes[0].dropped == 3
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+""" tests splunkhec.metrics """
+
+import json
+import re
+from uuid import uuid4
+
+import pytest
+import requests_mock
+
+from splunkhec import splunkhec
+from splunkhec.metrics import MetricAggregator, make_metric_event
+
+URLMATCHER = re.compile('.*')
+
+def test_make_metric_event() -> None:
+    """ builds the multi-measurement format """
+    event = make_metric_event({"cpu.idle": 90.1, "cpu.user": 4.2}, {"region": "us-west"}, 1600000000.0, index="metrics")
+    assert event == {
+        "time": 1600000000.0,
+        "event": "metric",
+        "index": "metrics",
+        "fields": {"region": "us-west", "metric_name:cpu.idle": 90.1, "metric_name:cpu.user": 4.2},
+    }
+
+def test_make_metric_event_empty() -> None:
+    """ a data point needs a measurement """
+    with pytest.raises(ValueError):
+        make_metric_event({})
+
+def test_aggregator_collect() -> None:
+    """ one data point per dimension set, regardless of dimension order """
+    hec = splunkhec(server='https://example.com:8088', token=str(uuid4()))
+    aggregator = MetricAggregator(hec, index="metrics", dimensions={"service": "login"})
+    for _ in range(10):
+        aggregator.counter("requests", dimensions={"endpoint": "/a", "method": "GET"})
+    aggregator.counter("requests", 5, dimensions={"method": "GET", "endpoint": "/a"})
+    aggregator.gauge("queue.depth", 3, dimensions={"endpoint": "/a", "method": "GET"})
+    aggregator.gauge("queue.depth", 7, dimensions={"endpoint": "/a", "method": "GET"})
+    for value in (0.1, 0.3, 0.2):
+        aggregator.timing("duration", value, dimensions={"endpoint": "/b"})
+
+    events = aggregator.collect(timestamp=1.0)
+    assert len(events) == 2
+    by_endpoint = {event["fields"]["endpoint"]: event["fields"] for event in events}
+    assert by_endpoint["/a"]["metric_name:requests"] == 15
+    assert by_endpoint["/a"]["metric_name:queue.depth"] == 7
+    assert by_endpoint["/a"]["service"] == "login"
+    assert by_endpoint["/b"]["metric_name:duration.count"] == 3
+    assert by_endpoint["/b"]["metric_name:duration.min"] == 0.1
+    assert by_endpoint["/b"]["metric_name:duration.max"] == 0.3
+    assert by_endpoint["/b"]["metric_name:duration.avg"] == pytest.approx(0.2)
+    assert aggregator.collect() == []
+
+def test_aggregator_flush() -> None:
+    """ flush sends everything in one request """
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text='{"text":"Success","code":0}', status_code=200)
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()))
+        aggregator = MetricAggregator(hec, index="metrics")
+        assert aggregator.flush() is None
+        aggregator.counter("a", dimensions={"x": "1"})
+        aggregator.counter("a", dimensions={"x": "2"})
+        aggregator.stop()
+        assert mock.call_count == 1
+        assert mock.last_request.path == "/services/collector/event"
+        lines = mock.last_request.body.split(b"\n")
+    assert [json.loads(line)["fields"]["x"] for line in lines] == ["1", "2"]
+
+def test_aggregator_flush_failed() -> None:
+    """ a 503 keeps the data points for the next interval, merged with anything newer """
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text='{"text":"Server is busy","code":9}', status_code=503)
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()))
+        aggregator = MetricAggregator(hec, index="metrics")
+        aggregator.counter("requests", 2)
+        aggregator.timing("duration", 0.5)
+        aggregator.gauge("depth", 1)
+        response = aggregator.flush()
+        assert response is not None and response.status_code == 503
+
+        aggregator.counter("requests", 3)
+        aggregator.timing("duration", 0.1)
+        aggregator.gauge("depth", 4)
+        mock.post(URLMATCHER, text='{"text":"Success","code":0}', status_code=200)
+        aggregator.flush()
+        assert mock.call_count == 2
+        fields = json.loads(mock.last_request.body)["fields"]
+    assert fields["metric_name:requests"] == 5
+    assert fields["metric_name:duration.count"] == 2
+    assert fields["metric_name:duration.min"] == 0.1
+    assert fields["metric_name:duration.max"] == 0.5
+    assert fields["metric_name:depth"] == 4
+
+def test_aggregator_flush_rejected() -> None:
+    """ a 400 won't get better, so the data points are dropped rather than sent again """
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text='{"text":"Invalid data format","code":6}', status_code=400)
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()))
+        aggregator = MetricAggregator(hec, index="metrics")
+        aggregator.counter("requests")
+        aggregator.flush()
+    assert aggregator.collect() == []
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+""" tests splunkhec.replay """
+
+import gzip
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import pytest
+import requests
+import requests_mock
+
+from splunkhec.hooks import STAGE_DROPPED, STAGE_RETRIED, Hooks
+from splunkhec.replay import Replayer, detect_format, iter_lines, split_ranges
+
+URLMATCHER = re.compile('.*')
+
+def test_detect_format() -> None:
+    """ picks hec for ndjson-ish names, even compressed """
+    assert detect_format("events.ndjson") == "hec"
+    assert detect_format("events.json.gz") == "hec"
+    assert detect_format("messages.log.gz") == "raw"
+    assert detect_format("events.ndjson", "raw") == "raw"
+
+def test_split_ranges_on_newlines() -> None:
+    """ ranges should cover everything, and only end after a newline """
+    data = b"".join(f"line {i}\n".encode() for i in range(100))
+    ranges = split_ranges(data, len(data), 50)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    lines: List[bytes] = []
+    for start, end in ranges:
+        assert data[end - 1:end] == b"\n"
+        lines.extend(line for line, _ in iter_lines(data, start, end))
+    assert lines == [f"line {i}".encode() for i in range(100)]
+
+def test_replay_and_resume(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """ sends raw, hec and gzip files, then a second run with the checkpoint sends nothing,
+        even with the paths written differently """
+    raw = tmp_path / "messages.log"
+    raw.write_bytes(b"".join(f"raw {i}\n".encode() for i in range(200)))
+    hec = tmp_path / "events.ndjson"
+    hec.write_bytes(b"".join(json.dumps({"event": f"hec {i}", "time": i}).encode() + b"\n" for i in range(50)))
+    compressed = tmp_path / "old.log.gz"
+    with gzip.open(compressed, "wb") as file_handle:
+        file_handle.write(b"".join(f"gz {i}\n".encode() for i in range(30)))
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    def make_replayer() -> Replayer:
+        return Replayer(
+            server="https://example.com:8088",
+            token=str(uuid4()),
+            index="main",
+            threads=4,
+            chunk_size=256,
+            batch_bytes=512,
+            checkpoint=checkpoint,
+        )
+
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text='{"text":"Success","code":0}', status_code=200)
+        make_replayer().replay([str(raw), str(hec), str(compressed)])
+        history = mock.request_history
+        events = [
+            json.loads(line)
+            for request in history
+            for line in request.body.split(b"\n")
+        ]
+    assert len(events) == 280
+    assert all(request.qs == {"auto_extract_timestamp": ["true"]} for request in history)
+    assert {event["event"] for event in events if event.get("source") == str(raw)} == {f"raw {i}" for i in range(200)}
+    assert sum(1 for event in events if str(event["event"]).startswith("gz ")) == 30
+    assert all(event.get("index") == "main" for event in events if "time" not in event)
+
+    monkeypatch.chdir(tmp_path)
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text='{"text":"Success","code":0}', status_code=200)
+        make_replayer().replay(["messages.log", "./events.ndjson", f"../{tmp_path.name}/old.log.gz"])
+        assert not mock.request_history
+
+def test_replay_bad_request_not_retried(tmp_path: Path) -> None:
+    """ a 400 won't get better by trying again, so it's dropped on the first attempt """
+    fired: List[Dict[str, Any]] = []
+    hooks = Hooks()
+    hooks.register(STAGE_DROPPED, fired.append)
+    hooks.register(STAGE_RETRIED, fired.append)
+    replayer = Replayer(
+        server="https://example.com:8088",
+        token=str(uuid4()),
+        threads=1,
+        hooks=hooks,
+        checkpoint=str(tmp_path / "checkpoint.json"),
+    )
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text='{"text":"Invalid data format","code":6}', status_code=400)
+        with pytest.raises(requests.exceptions.HTTPError):
+            replayer.send(b'{"event":"hello"}', 1)
+        assert mock.call_count == 1
+    assert [info["stage"] for info in fired] == [STAGE_DROPPED]
+    assert fired[0]["count"] == 1
+
+def test_replay_without_timestamp_extraction() -> None:
+    """ timestamp extraction can be turned off, and isn't added twice """
+    token = str(uuid4())
+    assert Replayer(server="example.com:8088", token=token, auto_extract_timestamp=False).endpoint == "/services/collector/event"
+    replayer = Replayer(server="example.com:8088", token=token, endpoint="/services/collector/event?auto_extract_timestamp=true")
+    assert replayer.endpoint == "/services/collector/event?auto_extract_timestamp=true"
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+""" tests streaming uploads """
+
+import gzip
+import json
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Tuple
+from uuid import uuid4
+
+import requests_mock
+
+from splunkhec import splunkhec
+from splunkhec.events import EventBatch, HecEvent
+from splunkhec.hooks import STAGE_COMPRESSED, Hooks
+from splunkhec.streaming import BodyStream, EventFeeder
+
+URLMATCHER = re.compile('.*')
+
+def test_body_stream_limits() -> None:
+    """ stops at max_events, leaving the rest for the next request """
+    feeder = EventFeeder(range(100))
+    stream = BodyStream(feeder.get(), feeder, EventBatch(index="main"), max_events=10, chunk_size=16)
+    chunks = list(stream)
+    assert len(chunks) > 1
+    assert all(chunks)
+    lines = b"".join(chunks).split(b"\n")
+    assert [json.loads(line)["event"] for line in lines] == list(range(10))
+    assert stream.raw_bytes == sum(len(chunk) for chunk in chunks)
+    assert not stream.exhausted
+    assert feeder.get() == 10
+    feeder.stop()
+
+def test_send_stream_stalled_generator() -> None:
+    """ a stalled generator doesn't hold the request open past max_seconds,
+    and what's already arrived goes on the wire while it waits """
+    release = threading.Event()
+    requests_seen: List[Tuple[float, float, bytes]] = []
+
+    def generate() -> Iterator[str]:
+        yield "before"
+        release.wait(5)
+        yield "after"
+
+    def callback(request: Any, context: Any) -> str:
+        start = time.monotonic()
+        chunks = iter(request.body)
+        decompressor = zlib.decompressobj(wbits=31)
+        first = decompressor.decompress(next(chunks))
+        first_at = time.monotonic() - start
+        rest = decompressor.decompress(b"".join(chunks))
+        requests_seen.append((first_at, time.monotonic() - start, first + rest))
+        if len(requests_seen) == 1:
+            release.set()
+        return '{"text":"Success","code":0}'
+
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text=callback, status_code=200)
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()))
+        responses = hec.send_stream(generate(), compress=True, max_seconds=0.5)
+    assert len(responses) == 2
+    first_at, elapsed, body = requests_seen[0]
+    # the event that arrived went out before the stall ended
+    assert first_at < 0.25
+    assert elapsed < 1.5
+    assert json.loads(body)["event"] == "before"
+    assert json.loads(requests_seen[1][2])["event"] == "after"
+
+def test_send_stream() -> None:
+    """ splits a generator over several gzipped requests, firing the compressed hook """
+    bodies: List[bytes] = []
+
+    def callback(request: Any, context: Any) -> str:
+        bodies.append(gzip.decompress(b"".join(request.body)))
+        return '{"text":"Success","code":0}'
+
+    def generate() -> Iterator[Any]:
+        for i in range(25):
+            yield f"event {i}"
+        yield HecEvent("overridden", index="other")
+
+    seen: List[Dict[str, Any]] = []
+    hooks = Hooks()
+    hooks.register(STAGE_COMPRESSED, seen.append)
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text=callback, status_code=200)
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()), hooks=hooks)
+        responses = hec.send_stream(generate(), index="main", compress=True, max_events=10)
+        assert mock.last_request.headers["Content-Encoding"] == "gzip"
+    assert len(responses) == 3
+    events = [json.loads(line) for body in bodies for line in body.split(b"\n")]
+    assert [event["event"] for event in events[:25]] == [f"event {i}" for i in range(25)]
+    assert events[-1] == {"event": "overridden", "index": "other"}
+    assert [info["count"] for info in seen] == [10, 10, 6]
+
+def test_send_stream_stops_on_error() -> None:
+    """ a failed request stops the stream """
+    def callback(request: Any, context: Any) -> str:
+        b"".join(request.body)
+        return '{"text":"Server is busy","code":9}'
+
+    with requests_mock.mock() as mock:
+        mock.post(URLMATCHER, text=callback, status_code=503)
+        hec = splunkhec(server='https://example.com:8088', token=str(uuid4()))
+        responses = hec.send_stream(iter(range(100)), max_events=10)
+    assert len(responses) == 1
+    assert responses[0].status_code == 503
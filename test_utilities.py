@@ -74,3 +74,11 @@ def test_make_uri_http_443() -> None:
 
 ##############################################
 # more tests?
+
+def test_mask_token() -> None:
+    """ only the end of the token is shown """
+    token = str(uuid.uuid4())
+    masked = splunkhec.utilities.mask_token(token)
+    assert len(masked) == len(token)
+    assert masked.endswith(token[-4:])
+    assert token[:-4] not in masked